@@ -3,10 +3,21 @@ import sys
 import subprocess
 import importlib.util
 import faiss
-import pickle
 import time
 import threading
-from transformers import T5Tokenizer, T5EncoderModel
+import gc
+import copy
+import zipfile
+import tempfile
+import shutil
+from contextlib import contextmanager
+import queue
+from concurrent.futures import Future
+from collections import namedtuple, OrderedDict
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 VENV_DIR = "venv"
 
@@ -46,6 +57,12 @@ REQUIRED_PACKAGES = [
     "werkzeug",
     "pyjwt"
 ]
+# Import names that differ from the pip package name
+PACKAGE_IMPORT_NAMES = {
+    "sentence-transformers": "sentence_transformers",
+    "scikit-learn": "sklearn",
+    "pyjwt": "jwt",
+}
 
 def ensure_requirements_file():
     if not os.path.exists(REQUIREMENTS_FILE):
@@ -56,10 +73,8 @@ def ensure_requirements_file():
 def install_missing_packages():
     missing = []
     for pkg in REQUIRED_PACKAGES:
-        try:
-            # Try to import the package (handle dash/underscore differences)
-            importlib.import_module(pkg.replace('-', '_'))
-        except ImportError:
+        # find_spec only locates the package, it doesn't import (and initialize) it
+        if importlib.util.find_spec(PACKAGE_IMPORT_NAMES.get(pkg, pkg)) is None:
             missing.append(pkg)
     if missing:
         print(f"Installing missing packages: {missing}")
@@ -70,14 +85,16 @@ install_missing_packages()
 
 from flask import Flask, request, jsonify, make_response
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
 from flask_cors import CORS
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import redis
 import logging
 from werkzeug.security import check_password_hash, generate_password_hash
 import json
+import hashlib
+import uuid
 import jwt
 import datetime
 from functools import wraps
@@ -99,27 +116,371 @@ CORS(app, supports_credentials=True, resources={r"*": {"origins": "*"}})
 db = SQLAlchemy(app)
 
 # Redis setup
-try:
-    cache = redis.Redis(host='localhost', port=6379, db=0)
-    cache.ping()
-    logger.info("Successfully connected to Redis.")
-except redis.ConnectionError as e:
-    logger.warning(f"Failed to connect to Redis: {e}. Caching will be disabled.")
-    cache = None
+REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+REDIS_DB = int(os.environ.get('REDIS_DB', 0))
+REDIS_SOCKET_TIMEOUT = 0.5  # seconds; a slow cache must not stall requests
+REDIS_FAILURE_THRESHOLD = 3  # consecutive errors before Redis is skipped
+REDIS_PROBE_INTERVAL = 5  # seconds between reconnect attempts while skipped
+
+class RedisCache:
+    """Pooled Redis client with a circuit breaker.
+
+    While Redis is healthy every call is a single pipelined round-trip. After
+    REDIS_FAILURE_THRESHOLD consecutive errors the circuit opens: reads return
+    misses and writes are dropped without touching the network, and a
+    background thread pings Redis until it answers and closes the circuit.
+    The circuit starts open, so a Redis that is down at startup is picked up
+    as soon as it comes back.
+    """
+
+    def __init__(self, host, port, db):
+        self.pool = redis.ConnectionPool(
+            host=host, port=port, db=db,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.available = False
+        self.probe_thread = None
+        self.start_probe()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Threads don't survive fork; a forked worker re-probes on its own
+        self.lock = threading.Lock()
+        self.probe_thread = None
+        if not self.available:
+            self.start_probe()
+
+    def start_probe(self):
+        with self.lock:
+            if self.probe_thread is not None and self.probe_thread.is_alive():
+                return
+            self.probe_thread = threading.Thread(target=self._probe, daemon=True)
+            self.probe_thread.start()
+
+    def _probe(self):
+        while True:
+            try:
+                self.client.ping()
+            except redis.RedisError:
+                time.sleep(REDIS_PROBE_INTERVAL)
+                continue
+            with self.lock:
+                self.available = True
+                self.failures = 0
+            logger.info("Successfully connected to Redis.")
+            return
+
+    def _record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            if not self.available or self.failures < REDIS_FAILURE_THRESHOLD:
+                return
+            self.available = False
+        logger.warning(f"Redis unavailable ({error}), caching disabled until it recovers.")
+        self.start_probe()
+
+    def get_many(self, keys):
+        if not self.available or not keys:
+            return [None] * len(keys)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(key)
+            values = pipe.execute()
+        except redis.RedisError as e:
+            self._record_failure(e)
+            return [None] * len(keys)
+        self.failures = 0
+        return values
+
+    def set_many(self, items, ex=None):
+        if not self.available or not items:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(key, value, ex=ex)
+            pipe.execute()
+        except redis.RedisError as e:
+            self._record_failure(e)
+            return
+        self.failures = 0
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def set(self, key, value, ex=None):
+        self.set_many({key: value}, ex=ex)
+
+    def publish(self, channel, message):
+        if not self.available:
+            return
+        try:
+            self.client.publish(channel, message)
+        except redis.RedisError as e:
+            self._record_failure(e)
+            return
+        self.failures = 0
+
+cache = RedisCache(REDIS_HOST, REDIS_PORT, REDIS_DB)
 
 # Load AI models
-sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
+# Models are loaded on first use (or by the warm-up thread, see MODEL_WARMUP)
+# so importing the app stays cheap and the non-similarity routes come up at once.
+SBERT_MODEL_NAME = 'all-MiniLM-L6-v2'
+T5_MODEL_NAME = 't5-small'
+SBERT_MAX_LENGTH = int(os.environ.get('SBERT_MAX_LENGTH', 256))  # tokens per encoder input;
+T5_MAX_LENGTH = int(os.environ.get('T5_MAX_LENGTH', 512))  # longer texts are encoded in chunks
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', 'background').lower()  # background | eager | lazy
+sbert_model = None
+t5_tokenizer = None
+t5_model = None
+model_lock = threading.Lock()
+
+def get_sbert_model():
+    global sbert_model
+    if sbert_model is None:
+        with model_lock:
+            if sbert_model is None:
+                from sentence_transformers import SentenceTransformer
+                sbert_model = SentenceTransformer(SBERT_MODEL_NAME)
+    return sbert_model
 
 # Load T5 model and tokenizer
-print("Loading T5 model...")
-t5_tokenizer = T5Tokenizer.from_pretrained('t5-small')
-t5_model = T5EncoderModel.from_pretrained('t5-small')
+def get_t5_model():
+    global t5_tokenizer, t5_model
+    if t5_model is None:
+        with model_lock:
+            if t5_model is None:
+                from transformers import T5Tokenizer, T5EncoderModel
+                print("Loading T5 model...")
+                t5_tokenizer = T5Tokenizer.from_pretrained(T5_MODEL_NAME)
+                t5_model = T5EncoderModel.from_pretrained(T5_MODEL_NAME)
+    return t5_tokenizer, t5_model
+
+# --- Encoder registry ---
+# Each encoder contributes one block of the similarity vector. An embedding
+# profile picks the blocks it uses and gets its own FAISS index, so a cheaper
+# profile can serve latency-critical traffic next to the full one.
+Encoder = namedtuple('Encoder', ['name', 'key', 'max_length'])
+ENCODERS = {
+    # key identifies the vectors an encoder produces: model, pooling, input length
+    'sbert': Encoder('sbert', f"{SBERT_MODEL_NAME}:{SBERT_MAX_LENGTH}", SBERT_MAX_LENGTH),
+    't5': Encoder('t5', f"{T5_MODEL_NAME}:masked-mean:{T5_MAX_LENGTH}", T5_MAX_LENGTH),
+}
+EMBEDDING_PROFILES = {
+    'sbert+t5': ('sbert', 't5'),
+    'sbert-only': ('sbert',),
+    't5-only': ('t5',),
+}
+EMBEDDING_PROFILE = os.environ.get('EMBEDDING_PROFILE', 'sbert+t5')  # for requests that don't pick one
+
+def resolve_profile(profile):
+    profile = profile or EMBEDDING_PROFILE
+    if profile not in EMBEDDING_PROFILES:
+        raise ValueError(f"Unknown embedding profile '{profile}', expected one of: {', '.join(EMBEDDING_PROFILES)}")
+    return profile
+
+resolve_profile(EMBEDDING_PROFILE)
+
+# --- Pooling ---
+# Token vectors are averaged over real tokens only, so an input's embedding
+# doesn't depend on how much padding its batch needed. Inputs longer than the
+# encoder's max length are split into chunks whose vectors are averaged,
+# weighted by token count, instead of being silently truncated.
+CHUNK_OVERLAP = 32  # tokens shared by consecutive chunks
+
+def masked_mean_pool(hidden, attention_mask):
+    """Mean of (batch, seq, dim) token vectors over positions where the mask is 1."""
+    mask = attention_mask[..., None].astype(hidden.dtype)
+    return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+
+def split_into_chunks(tokenizer, text, max_tokens):
+    """Split text into (chunk_text, token_count) pieces that fit max_tokens."""
+    budget = max_tokens - tokenizer.num_special_tokens_to_add()
+    tokens = tokenizer.tokenize(text)
+    if len(tokens) <= budget:
+        return [(text, max(len(tokens), 1))]
+    step = max(budget - min(CHUNK_OVERLAP, budget // 4), 1)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        piece = tokens[start:start + budget]
+        chunks.append((tokenizer.convert_tokens_to_string(piece), len(piece)))
+        if start + budget >= len(tokens):
+            break
+    return chunks
+
+def encode_chunked(texts, tokenizer, max_tokens, encode_fn, batch_size):
+    """Encode texts with encode_fn, pooling the chunk vectors of long texts."""
+    chunks, owners, weights = [], [], []
+    for i, text in enumerate(texts):
+        for chunk, token_count in split_into_chunks(tokenizer, text, max_tokens):
+            chunks.append(chunk)
+            owners.append(i)
+            weights.append(token_count)
+    vectors = np.concatenate([
+        np.asarray(encode_fn(chunks[start:start + batch_size]), dtype='float32')
+        for start in range(0, len(chunks), batch_size)
+    ])
+    if len(chunks) == len(texts):
+        return vectors
+    weights = np.asarray(weights, dtype='float32')
+    pooled = np.zeros((len(texts), vectors.shape[1]), dtype='float32')
+    totals = np.zeros(len(texts), dtype='float32')
+    np.add.at(pooled, owners, vectors * weights[:, None])
+    np.add.at(totals, owners, weights)
+    return pooled / totals[:, None]
+
+# --- Inference backends ---
+# The encoders can run as plain torch, as torch with int8 dynamic quantization
+# or under ONNX Runtime. All backends produce vectors for the same models, so
+# stored embeddings and the index stay valid when the backend changes;
+# check_backend_parity() measures how closely a backend reproduces the float
+# torch vectors.
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch').lower()  # torch | quantized | onnx
+ONNX_EXPORT_DIR = "onnx_models"
+encoder_backend = None
+backend_lock = threading.Lock()
+
+class TorchBackend:
+    """SBERT and T5 in PyTorch, run under torch.inference_mode()."""
+    name = 'torch'
+
+    def __init__(self, models=None):
+        # models: (sbert, t5_tokenizer, t5) to use instead of the shared ones
+        self.sbert, self.t5_tokenizer, self.t5 = models or (get_sbert_model(), *get_t5_model())
+        self.sbert.max_seq_length = SBERT_MAX_LENGTH
+        self.sbert_tokenizer = self.sbert.tokenizer
+        self.sbert_dim = self.sbert.get_sentence_embedding_dimension()
+        self.t5_dim = self.t5.config.d_model
+
+    def encode_sbert(self, texts):
+        import torch
+        with torch.inference_mode():
+            return self.sbert.encode(texts, batch_size=len(texts))
+
+    def encode_t5(self, texts):
+        import torch
+        inputs = self.t5_tokenizer(texts, return_tensors='pt', padding=True, truncation=True, max_length=T5_MAX_LENGTH)
+        with torch.inference_mode():
+            hidden = self.t5(**inputs).last_hidden_state
+        return masked_mean_pool(hidden.numpy(), inputs['attention_mask'].numpy())
+
+class QuantizedBackend(TorchBackend):
+    """TorchBackend with every Linear layer dynamically quantized to int8."""
+    name = 'quantized'
+
+    def __init__(self):
+        super().__init__()
+        import torch
+        # In place, so the float weights aren't kept around as well
+        torch.ao.quantization.quantize_dynamic(self.sbert, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        torch.ao.quantization.quantize_dynamic(self.t5, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+class OnnxBackend:
+    """Both encoders under ONNX Runtime's CPU provider.
+
+    Needs the optional onnxruntime and optimum packages. SBERT is exported by
+    sentence-transformers itself; the T5 encoder is exported once into
+    ONNX_EXPORT_DIR.
+    """
+    name = 'onnx'
+
+    def __init__(self):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("INFERENCE_BACKEND=onnx needs 'pip install onnxruntime optimum'")
+        from sentence_transformers import SentenceTransformer
+        from transformers import T5Config, T5Tokenizer
+        self.sbert = SentenceTransformer(SBERT_MODEL_NAME, backend='onnx')
+        self.sbert.max_seq_length = SBERT_MAX_LENGTH
+        self.sbert_tokenizer = self.sbert.tokenizer
+        self.t5_tokenizer = T5Tokenizer.from_pretrained(T5_MODEL_NAME)
+        path = os.path.join(ONNX_EXPORT_DIR, f"{T5_MODEL_NAME}-encoder.onnx")
+        if not os.path.exists(path):
+            export_t5_encoder_onnx(self.t5_tokenizer, path)
+        self.t5_session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.sbert_dim = self.sbert.get_sentence_embedding_dimension()
+        self.t5_dim = T5Config.from_pretrained(T5_MODEL_NAME).d_model
+
+    def encode_sbert(self, texts):
+        return self.sbert.encode(texts, batch_size=len(texts))
+
+    def encode_t5(self, texts):
+        inputs = self.t5_tokenizer(texts, return_tensors='np', padding=True, truncation=True, max_length=T5_MAX_LENGTH)
+        hidden = self.t5_session.run(['last_hidden_state'], {
+            'input_ids': inputs['input_ids'].astype('int64'),
+            'attention_mask': inputs['attention_mask'].astype('int64'),
+        })[0]
+        return masked_mean_pool(hidden, inputs['attention_mask'])
+
+def export_t5_encoder_onnx(tokenizer, path):
+    import torch
+    from transformers import T5EncoderModel
+
+    class EncoderOutput(torch.nn.Module):
+        # ONNX export needs a plain tensor output rather than a ModelOutput
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    print("Exporting T5 encoder to ONNX...")
+    model = T5EncoderModel.from_pretrained(T5_MODEL_NAME).eval()
+    sample = tokenizer(["onnx export sample"], return_tensors='pt')
+    export_dir = os.path.dirname(path)
+    os.makedirs(export_dir, exist_ok=True)
+    # Export into a scratch directory (the exporter may write external weight
+    # files next to the model), then move the model file in last
+    tmp_dir = tempfile.mkdtemp(dir=export_dir)
+    tmp_path = os.path.join(tmp_dir, os.path.basename(path))
+    torch.onnx.export(
+        EncoderOutput(model),
+        (sample['input_ids'], sample['attention_mask']),
+        tmp_path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['last_hidden_state'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'last_hidden_state': {0: 'batch', 1: 'sequence'},
+        },
+        opset_version=14,
+    )
+    for name in os.listdir(tmp_dir):
+        if name != os.path.basename(path):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(export_dir, name))
+    os.replace(tmp_path, path)
+    os.rmdir(tmp_dir)
+
+INFERENCE_BACKENDS = {
+    'torch': TorchBackend,
+    'quantized': QuantizedBackend,
+    'onnx': OnnxBackend,
+}
+
+def get_encoder_backend():
+    global encoder_backend
+    if encoder_backend is None:
+        with backend_lock:
+            if encoder_backend is None:
+                if INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+                    raise ValueError(f"Unknown INFERENCE_BACKEND '{INFERENCE_BACKEND}'")
+                encoder_backend = INFERENCE_BACKENDS[INFERENCE_BACKEND]()
+    return encoder_backend
 
 # Function to generate T5 features
 def generate_t5_features(texts):
-    inputs = t5_tokenizer(texts, return_tensors='pt', padding=True, truncation=True)
-    outputs = t5_model(**inputs).last_hidden_state.mean(dim=1)
-    return outputs.detach().numpy()
+    return get_encoder_backend().encode_t5(texts)
 
 # Database Models
 class User(db.Model):
@@ -140,6 +501,25 @@ class Project(db.Model):
     title = db.Column(db.String(100), nullable=False)
     summary = db.Column(db.Text, nullable=False)
     domain = db.Column(db.String(50), nullable=False)
+    # Identifies a project by its text, so bulk imports can upsert (see bulk_import.py)
+    content_hash = db.Column(db.String(64), unique=True, index=True)
+
+def project_content_hash(title, summary):
+    return hashlib.sha256(f"{(title or '').strip()}\0{(summary or '').strip()}".encode('utf-8')).hexdigest()
+
+@event.listens_for(Project, 'before_insert')
+@event.listens_for(Project, 'before_update')
+def set_project_content_hash(mapper, connection, target):
+    state = inspect(target)
+    if target.content_hash is None or state.attrs.title.history.has_changes() or state.attrs.summary.history.has_changes():
+        target.content_hash = project_content_hash(target.title, target.summary)
+
+class ProjectEmbedding(db.Model):
+    # Cached embedding per project; reused while content_hash still matches
+    project_id = db.Column(db.Integer, primary_key=True)
+    model = db.Column(db.String(200), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)
 
 class History(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -195,146 +575,1713 @@ def preprocess_text(text):
     return text.lower().strip()
 
 # Update compute_project_embedding to use both SBERT and T5
+EMBEDDING_BATCH_SIZE = 32
+
+# A project's embedding is the weighted mean of its title and summary vectors.
+# Each field is encoded once and cached on its own, so editing one field only
+# re-encodes that field.
+TITLE_WEIGHT = float(os.environ.get('TITLE_WEIGHT', 1.0))
+SUMMARY_WEIGHT = float(os.environ.get('SUMMARY_WEIGHT', 2.0))
+
+def field_cache_key(encoder, text):
+    payload = f"{ENCODERS[encoder].key}\0{text}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def encode_texts(texts, encoder, batch_size=EMBEDDING_BATCH_SIZE, backend=None):
+    """Run one encoder over texts, returning a (n, dim) float32 array.
+
+    Texts are sorted by length before batching so each mini-batch pads to a
+    similar length, then results are put back in input order.
+    """
+    backend = backend or get_encoder_backend()
+    tokenizer = getattr(backend, f"{encoder}_tokenizer")
+    encode_fn = getattr(backend, f"encode_{encoder}")
+    features = np.empty((len(texts), getattr(backend, f"{encoder}_dim")), dtype='float32')
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        batch_texts = [texts[i] for i in batch]
+        features[batch] = encode_chunked(batch_texts, tokenizer, ENCODERS[encoder].max_length, encode_fn, batch_size)
+    return features
+
+def encode_fields(texts, encoder, batch_size=EMBEDDING_BATCH_SIZE, use_cache=True, backend=None):
+    """Embed field texts with one encoder, returning vectors in input order.
+
+    Known texts are served from the in-process LRU, then from Redis; only the
+    rest reach the models. Index builds pass use_cache=False so a full corpus
+    pass doesn't evict the entries user queries rely on. An explicit backend
+    always bypasses the caches, which hold the active backend's vectors.
+    """
+    if not use_cache or backend is not None:
+        return list(encode_texts(texts, encoder, batch_size, backend))
+    keys = [field_cache_key(encoder, text) for text in texts]
+    features = embedding_cache.get_many(keys)
+    missing = [i for i, emb in enumerate(features) if emb is None]
+    if missing:
+        shared = cache.get_many([f"embedding:{keys[i]}" for i in missing])
+        found = {keys[i]: np.frombuffer(blob, dtype='float32') for i, blob in zip(missing, shared) if blob}
+        embedding_cache.record_shared_hits(len(found))
+        embedding_cache.put_many(found)
+        for i in missing:
+            features[i] = found.get(keys[i])
+        missing = [i for i in missing if features[i] is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        if INFERENCE_BATCHING:
+            fresh = inference_batcher.encode(missing_texts, encoder)
+        else:
+            fresh = encode_texts(missing_texts, encoder, batch_size)
+        computed = {keys[i]: emb for i, emb in zip(missing, fresh)}
+        embedding_cache.put_many(computed)
+        cache.set_many({f"embedding:{key}": emb.tobytes() for key, emb in computed.items()}, ex=EMBEDDING_CACHE_TTL)
+        for i, emb in zip(missing, fresh):
+            features[i] = emb
+    return features
+
+def compute_encoder_embeddings(titles, summaries, encoders, batch_size=EMBEDDING_BATCH_SIZE, use_cache=True,
+                               backend=None):
+    """Embed many projects with each encoder, returning {encoder: (n, dim) array}."""
+    title_texts = [preprocess_text(title) for title in titles]
+    summary_texts = [preprocess_text(summary) for summary in summaries]
+    # An empty field carries no meaning, so it is left out of the mean unless
+    # both fields are empty
+    row_fields = []
+    for title, summary in zip(title_texts, summary_texts):
+        fields = [(TITLE_WEIGHT, title), (SUMMARY_WEIGHT, summary)]
+        if title or summary:
+            fields = [(weight, text) for weight, text in fields if text]
+        row_fields.append(fields)
+    # Each distinct field text is encoded once, however many projects share it
+    unique = list(dict.fromkeys(text for fields in row_fields for _, text in fields))
+    embeddings = {}
+    for encoder in encoders:
+        vectors = dict(zip(unique, encode_fields(unique, encoder, batch_size, use_cache, backend)))
+        embeddings[encoder] = np.array([
+            sum(weight * vectors[text] for weight, text in fields) / sum(weight for weight, _ in fields)
+            for fields in row_fields
+        ], dtype='float32', ndmin=2)
+    return embeddings
+
+def compute_project_embeddings(titles, summaries, batch_size=EMBEDDING_BATCH_SIZE, use_cache=True, profile=None):
+    """Embed many projects at once, returning a (n, dim) float32 array.
+
+    Only the encoders of the given (or default) profile are run.
+    """
+    encoders = EMBEDDING_PROFILES[resolve_profile(profile)]
+    embeddings = compute_encoder_embeddings(titles, summaries, encoders, batch_size, use_cache)
+    return np.concatenate([embeddings[encoder] for encoder in encoders], axis=1)
+
+def compute_project_embedding(title, summary, profile=None):
+    return compute_project_embeddings([title], [summary], profile=profile)[0]
+
+# --- Inference micro-batching ---
+INFERENCE_BATCHING = os.environ.get('INFERENCE_BATCHING', '1') == '1'
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', 5))
+INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', 64))  # texts per forward pass
+
+class InferenceBatcher:
+    """Runs concurrent encode requests as one batch on a single worker thread.
+
+    Request threads enqueue their texts and wait on a Future. The worker takes
+    the first waiting request, keeps collecting for up to window_ms (or until
+    max_batch texts are queued), runs one batched pass per requested encoder
+    and hands every caller its own rows. Only this thread runs the models, so
+    request threads no longer compete for torch's thread pool.
+    """
+
+    def __init__(self, encode_fn, window_ms, max_batch):
+        self.encode_fn = encode_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        self.queue = None
+        self.worker = None
+        self.pid = None
+
+    def encode(self, texts, encoder):
+        future = Future()
+        self._ensure_worker().put((encoder, texts, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        with self.lock:
+            # A forked process inherits the object but not the thread
+            if self.worker is None or not self.worker.is_alive() or self.pid != os.getpid():
+                self.queue = queue.Queue()
+                self.pid = os.getpid()
+                self.worker = threading.Thread(target=self._run, args=(self.queue,), daemon=True)
+                self.worker.start()
+            return self.queue
+
+    def _run(self, requests):
+        while True:
+            batch = [requests.get()]
+            count = len(batch[0][1])
+            deadline = time.monotonic() + self.window
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                count += len(item[1])
+            for encoder in dict.fromkeys(item[0] for item in batch):
+                group = [(texts, future) for name, texts, future in batch if name == encoder]
+                try:
+                    features = self.encode_fn([text for texts, _ in group for text in texts], encoder)
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+                start = 0
+                for texts, future in group:
+                    future.set_result(features[start:start + len(texts)])
+                    start += len(texts)
+
+inference_batcher = InferenceBatcher(encode_texts, INFERENCE_BATCH_WINDOW_MS, INFERENCE_MAX_BATCH)
+
+# --- In-process embedding cache ---
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 10000))  # entries (~3.5KB each)
+EMBEDDING_CACHE_TTL = 86400  # seconds embeddings are kept in the shared Redis tier
+
+class EmbeddingCache:
+    """Bounded LRU of embeddings keyed by the hash of their encoder input."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def get_many(self, keys):
+        with self.lock:
+            values = []
+            for key in keys:
+                value = self.entries.get(key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                values.append(value)
+            return values
+
+    def put_many(self, items):
+        with self.lock:
+            for key, value in items.items():
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def record_shared_hits(self, count):
+        with self.lock:
+            self.shared_hits += count
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'redis_hits': self.shared_hits,
+            }
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE)
+
+# --- Persistent embedding store ---
+# Embeddings live in the project_embedding table, one row per project and
+# encoder, keyed by (project_id, model). Profiles sharing an encoder share its
+# rows. The content hash covers both fields plus the model and weighting
+# scheme, so a rebuild only re-embeds rows whose text or models changed.
+STORE_QUERY_CHUNK = 500  # keeps IN (...) lists under SQLite's parameter limit
+
+def encoder_store_key(encoder):
+    # Stored project vectors also depend on the field weights
+    return f"{ENCODERS[encoder].key}:title={TITLE_WEIGHT:g},summary={SUMMARY_WEIGHT:g}"
+
+def profile_embedding_key(profile):
+    return '+'.join(encoder_store_key(encoder) for encoder in EMBEDDING_PROFILES[profile])
+
+def embedding_content_hash(title, summary, encoder):
+    payload = f"{encoder_store_key(encoder)}\0{preprocess_text(title)}\0{preprocess_text(summary)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def load_stored_embeddings(encoder, project_ids=None):
+    query = ProjectEmbedding.query.filter_by(model=encoder_store_key(encoder))
+    if project_ids is None:
+        entries = query.all()
+    else:
+        project_ids = list(project_ids)
+        entries = []
+        for start in range(0, len(project_ids), STORE_QUERY_CHUNK):
+            chunk = project_ids[start:start + STORE_QUERY_CHUNK]
+            entries.extend(query.filter(ProjectEmbedding.project_id.in_(chunk)).all())
+    return {e.project_id: (e.content_hash, np.frombuffer(e.vector, dtype='float32')) for e in entries}
+
+def save_stored_embeddings(encoder, entries):
+    """Upsert (project_id, content_hash, embedding) tuples into the store."""
+    if not entries:
+        return
+    db.session.execute(
+        ProjectEmbedding.__table__.insert().prefix_with('OR REPLACE'),
+        [{
+            'project_id': pid,
+            'model': encoder_store_key(encoder),
+            'content_hash': content_hash,
+            'vector': np.asarray(emb, dtype='float32').tobytes()
+        } for pid, content_hash, emb in entries]
+    )
+    db.session.commit()
+
+def prune_stored_embeddings():
+    # Drop rows for deleted projects and for encoder settings no longer in use.
+    # Rows of every registered encoder are kept, whichever profiles are active.
+    ProjectEmbedding.query.filter(
+        ProjectEmbedding.model.notin_([encoder_store_key(encoder) for encoder in ENCODERS])
+        | ~ProjectEmbedding.project_id.in_(db.select(Project.id))
+    ).delete(synchronize_session=False)
+    db.session.commit()
 
-def compute_project_embedding(title, summary):
-    text = preprocess_text(f"{title} {summary} {summary}")
-    sbert_features = sbert_model.encode([text])
-    t5_features = generate_t5_features([text])
-    features = np.concatenate([sbert_features, t5_features], axis=1)
-    return features[0]
+def get_project_embeddings(rows, encoders):
+    """Per-encoder embeddings for (id, title, summary, ...) rows.
+
+    Returns {encoder: (n, dim) array}, re-embedding only rows whose stored
+    vector for that encoder is missing or stale.
+    """
+    ids = [row[0] for row in rows]
+    embeddings = {}
+    for encoder in encoders:
+        hashes = [embedding_content_hash(row[1], row[2], encoder) for row in rows]
+        stored = load_stored_embeddings(encoder, ids)
+        vectors = [None] * len(rows)
+        stale = []
+        for i, (pid, content_hash) in enumerate(zip(ids, hashes)):
+            hit = stored.get(pid)
+            if hit and hit[0] == content_hash:
+                vectors[i] = hit[1]
+            else:
+                stale.append(i)
+        if stale:
+            logger.info(f"Embedding {len(stale)} new or changed projects with {encoder} ({len(rows) - len(stale)} reused).")
+            fresh = compute_encoder_embeddings([rows[i][1] for i in stale], [rows[i][2] for i in stale],
+                                               (encoder,), use_cache=False)[encoder]
+            for i, emb in zip(stale, fresh):
+                vectors[i] = emb
+            save_stored_embeddings(encoder, [(ids[i], hashes[i], vectors[i]) for i in stale])
+        embeddings[encoder] = np.stack(vectors).astype('float32')
+    return embeddings
+
+PARITY_SAMPLE_SIZE = 64
+PARITY_MIN_COSINE = 0.99  # below this a backend would noticeably shift rankings
+
+def load_reference_backend(backend):
+    # Float torch models; QuantizedBackend quantizes the shared ones in place,
+    # so other backends get private copies
+    if backend.name == 'torch':
+        return backend
+    from sentence_transformers import SentenceTransformer
+    from transformers import T5Tokenizer, T5EncoderModel
+    return TorchBackend((SentenceTransformer(SBERT_MODEL_NAME), T5Tokenizer.from_pretrained(T5_MODEL_NAME),
+                         T5EncoderModel.from_pretrained(T5_MODEL_NAME)))
+
+def check_backend_parity(sample_size=PARITY_SAMPLE_SIZE):
+    """Compare the active inference backend against float torch inference.
+
+    Both encode the same random sample of projects; for each encoder the
+    report gives the cosine similarity between the two. Stored embeddings
+    aren't a usable reference, since they may come from the active backend.
+    """
+    rows = db.session.query(Project.title, Project.summary).order_by(db.func.random()).limit(sample_size).all()
+    if not rows:
+        return None
+    backend = get_encoder_backend()
+    reference = load_reference_backend(backend)
+    titles, summaries = [row[0] for row in rows], [row[1] for row in rows]
+    report = {'backend': backend.name, 'samples': len(rows)}
+    a = compute_encoder_embeddings(titles, summaries, tuple(ENCODERS), use_cache=False, backend=reference)
+    b = compute_encoder_embeddings(titles, summaries, tuple(ENCODERS), use_cache=False, backend=backend)
+    for encoder in ENCODERS:
+        x, y = a[encoder], b[encoder]
+        cosines = (x * y).sum(axis=1) / np.maximum(np.linalg.norm(x, axis=1) * np.linalg.norm(y, axis=1), 1e-12)
+        report[f'{encoder}_mean_cosine'] = float(cosines.mean())
+        report[f'{encoder}_min_cosine'] = float(cosines.min())
+    report['ok'] = all(report[f'{encoder}_min_cosine'] >= PARITY_MIN_COSINE for encoder in ENCODERS)
+    return report
+
+parity_report = None
+parity_lock = threading.Lock()
+
+def backend_parity_report():
+    # Checked once per process: each check loads a private float model pair
+    global parity_report
+    with parity_lock:
+        if parity_report is None:
+            parity_report = check_backend_parity()
+    return parity_report
 
 # --- FAISS Integration for Fast Similarity Search ---
-FAISS_INDEX_FILE = "faiss.index"
-EMBEDDINGS_FILE = "project_embeddings.pkl"
-ID_MAP_FILE = "project_id_map.pkl"
+INDEX_DRIFT_CHECK_INTERVAL = 60  # seconds between project table drift checks
+INDEX_BUILD_CHUNK = int(os.environ.get('INDEX_BUILD_CHUNK', 2000))  # projects read and embedded per step
+
+# Index type: one of INDEX_TYPE_ALIASES or any FAISS factory string
+# (e.g. "IVF1024,Flat", "HNSW32", "IVF4096,PQ64")
+FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE', 'flat')
+FAISS_NPROBE = int(os.environ.get('FAISS_NPROBE', 16))  # IVF lists probed per query
+FAISS_EF_SEARCH = int(os.environ.get('FAISS_EF_SEARCH', 64))  # HNSW candidate list size
+FAISS_TRAIN_SAMPLE = 100000  # max vectors used to train IVF/PQ indexes
+# 'l2' keeps the raw concatenated vectors and scores 1 / (1 + distance);
+# 'cosine' L2-normalizes each encoder's block and searches by inner product
+SIMILARITY_METRIC = os.environ.get('SIMILARITY_METRIC', 'l2').lower()
+SBERT_WEIGHT = float(os.environ.get('SBERT_WEIGHT', 1.0))  # block weights in cosine mode
+T5_WEIGHT = float(os.environ.get('T5_WEIGHT', 1.0))
+ENCODER_WEIGHTS = {'sbert': SBERT_WEIGHT, 't5': T5_WEIGHT}
+FAISS_METRIC = faiss.METRIC_INNER_PRODUCT if SIMILARITY_METRIC == 'cosine' else faiss.METRIC_L2
+INDEX_TYPE_ALIASES = {
+    'flat': 'Flat',
+    'ivf': 'IVF{nlist},Flat',
+    'hnsw': 'HNSW32',
+    'ivfpq': 'IVF{nlist},PQ{pq_m}',
+}
+
+# --- Project metadata cache ---
+# Similarity results only need title/summary/domain, so a columnar copy of
+# those fields is kept next to the index and the hot path never hits SQLite.
+ProjectRecord = namedtuple('ProjectRecord', ['id', 'title', 'summary', 'domain'])
+
+class ProjectMetadata:
+    """Read-mostly columnar project fields, row-aligned with a base index's id_map.
+
+    Instances are never modified in place. Rows added or changed later are
+    kept in a small overlay; the helpers return copies that share the
+    columns, so an update costs the size of the overlay, not the corpus, and
+    readers holding the old instance keep a consistent view.
+    """
+
+    def __init__(self, ids, titles, summaries, domains):
+        self.ids = np.asarray(ids, dtype='int64')
+        self.titles = np.array(titles, dtype=object)
+        self.summaries = np.array(summaries, dtype=object)
+        self.domains = np.array(domains, dtype=object)
+        self.row_of = {int(pid): row for row, pid in enumerate(self.ids)}
+        self.overlay = {}  # project id -> ProjectRecord, wins over the columns
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        return cls([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows])
+
+    def get(self, project_id):
+        record = self.overlay.get(project_id)
+        if record is not None:
+            return record
+        row = self.row_of.get(project_id)
+        if row is None or self.titles[row] is None:
+            return None
+        return ProjectRecord(project_id, self.titles[row], self.summaries[row], self.domains[row])
+
+    def with_records(self, rows):
+        # Adds or replaces (id, title, summary, domain) rows
+        updated = copy.copy(self)
+        updated.overlay = {**self.overlay, **{row[0]: ProjectRecord(*row) for row in rows}}
+        return updated
+
+    def knows(self, project_id):
+        return project_id in self.overlay or project_id in self.row_of
+
+def load_project_metadata(id_map):
+    rows = db.session.query(Project.id, Project.title, Project.summary, Project.domain).all()
+    by_id = {row[0]: row for row in rows}
+    return ProjectMetadata.from_rows(by_id.get(pid, (pid, None, None, None)) for pid in map(int, id_map))
+
+# --- Index bundles ---
+# A bundle is index_bundles/<profile>/<version>/ with the FAISS index
+# (memory-mapped read-only on load), ids.npy, a manifest.json and, for
+# non-Flat indexes, the vectors as embeddings.npy. Bundles are written to a
+# scratch directory and renamed; CURRENT names the live one, plus its delta
+# if it has one ("<version> <delta version>").
+INDEX_BUNDLE_DIR = "index_bundles"
+INDEX_BUNDLE_FORMAT = 1
+INDEX_BUNDLES_KEPT = 2  # older versions are deleted after a save
+BUNDLE_INDEX_FILE = "index.faiss"
+BUNDLE_EMBEDDINGS_FILE = "embeddings.npy"
+BUNDLE_IDS_FILE = "ids.npy"
+BUNDLE_MANIFEST_FILE = "manifest.json"
+BUNDLE_CURRENT_FILE = "CURRENT"
+BUNDLE_DELTA_PREFIX = "delta-"
+# Checked on a process's first load only; reloads trust bundles their writer checksummed
+INDEX_VERIFY_CHECKSUMS = os.environ.get('INDEX_VERIFY_CHECKSUMS', '1') == '1'
+# MMAP_IFC also maps Flat and HNSW storage, not only IVF lists (FAISS >= 1.8)
+INDEX_READ_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+# With 0, a bundle that doesn't match the configuration fails the load (and
+# /ready) instead of being rebuilt
+INDEX_REBUILD_ON_MISMATCH = os.environ.get('INDEX_REBUILD_ON_MISMATCH', '1') == '1'
+
+class IndexBundleError(Exception):
+    """A saved index bundle is corrupt or was built with other settings."""
+
+def bundle_dir(profile):
+    return os.path.join(INDEX_BUNDLE_DIR, profile)
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def bundle_settings(profile):
+    # Everything that must match for a saved bundle to be searched as-is
+    encoders = EMBEDDING_PROFILES[profile]
+    settings = {
+        'profile': profile,
+        'encoders': {encoder: encoder_store_key(encoder) for encoder in encoders},
+        'metric': SIMILARITY_METRIC,
+    }
+    if SIMILARITY_METRIC == 'cosine':
+        settings['encoder_scales'] = encoder_scales(profile)
+    return settings
+
+def write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def write_index_bundle(profile, snapshot):
+    # Saves the base index only; see write_index_delta for the rest
+    root = bundle_dir(profile)
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=root)
+    faiss.write_index(snapshot.index, os.path.join(tmp_dir, BUNDLE_INDEX_FILE))
+    np.save(os.path.join(tmp_dir, BUNDLE_IDS_FILE), np.asarray(snapshot.id_map, dtype='int64'))
+    files = [BUNDLE_INDEX_FILE, BUNDLE_IDS_FILE]
+    if flat_index_vectors(snapshot.index) is None:
+        np.save(os.path.join(tmp_dir, BUNDLE_EMBEDDINGS_FILE), np.ascontiguousarray(snapshot.embeddings, dtype='float32'))
+        files.append(BUNDLE_EMBEDDINGS_FILE)
+    manifest = {
+        'format': INDEX_BUNDLE_FORMAT,
+        **bundle_settings(profile),
+        'index_spec': snapshot.spec,
+        'dimension': int(snapshot.index.d),
+        'rows': len(snapshot.id_map),
+        'version': snapshot.base_version,
+        'built_at': snapshot.built_at,
+        'created_at': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'checksums': {name: file_checksum(os.path.join(tmp_dir, name)) for name in files},
+    }
+    write_atomic(os.path.join(tmp_dir, BUNDLE_MANIFEST_FILE), json.dumps(manifest, indent=2))
+    target = os.path.join(root, snapshot.base_version)
+    if os.path.exists(target):
+        shutil.rmtree(tmp_dir)  # this version is already on disk
+    else:
+        os.replace(tmp_dir, target)
+    write_atomic(os.path.join(root, BUNDLE_CURRENT_FILE), snapshot.base_version)
+    prune_index_bundles(profile, snapshot.base_version)
+
+def write_index_delta(profile, snapshot):
+    path = os.path.join(bundle_dir(profile), snapshot.base_version)
+    name = f"{BUNDLE_DELTA_PREFIX}{snapshot.version}.npz"
+    tmp_path = os.path.join(path, f".{name}.{os.getpid()}.tmp")
+    delta = snapshot.delta
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, ids=delta.id_map, embeddings=delta.embeddings, removed=delta.removed, updated=delta.updated)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(path, name))
+    write_atomic(os.path.join(bundle_dir(profile), BUNDLE_CURRENT_FILE), bundle_key(snapshot))
+    # Keep the previous delta too; a reader may have just read it from CURRENT
+    older = sorted((entry for entry in os.scandir(path)
+                    if entry.name.startswith(BUNDLE_DELTA_PREFIX) and entry.name != name),
+                   key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in older[1:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def prune_index_bundles(profile, current):
+    # Processes still memory-mapping a deleted bundle keep reading it until
+    # they drop the mapping; the files only disappear from the directory
+    root = bundle_dir(profile)
+    for entry in os.scandir(root):
+        if entry.is_file() and entry.name.startswith('.build-'):
+            try:
+                os.remove(entry.path)  # matrices of finished builds (see build_profile_index)
+            except OSError:
+                pass
+    versions = sorted((entry for entry in os.scandir(root)
+                       if entry.is_dir() and entry.name != current and not entry.name.startswith('.')),
+                      key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[INDEX_BUNDLES_KEPT - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+def read_index_bundle(profile, version=None, verify_checksums=False):
+    """Load a profile's bundle, returning (index, embeddings, id_map, manifest).
+
+    version defaults to the published bundle. Hashing the files reads all of
+    them, so verify_checksums is only worth it on a cold start. Raises FileNotFoundError when
+    no bundle has been published, and IndexBundleError when it is corrupt or
+    doesn't match the running configuration (models, field weights, metric).
+    """
+    if version is None:
+        with open(os.path.join(bundle_dir(profile), BUNDLE_CURRENT_FILE)) as f:
+            version = f.read().split()[0]
+    path = os.path.join(bundle_dir(profile), version)
+    try:
+        with open(os.path.join(path, BUNDLE_MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise IndexBundleError(f"unreadable manifest ({e})")
+    if manifest.get('format') != INDEX_BUNDLE_FORMAT:
+        raise IndexBundleError(f"format is {manifest.get('format')!r}, expected {INDEX_BUNDLE_FORMAT}")
+    for key, expected in bundle_settings(profile).items():
+        if manifest.get(key) != expected:
+            raise IndexBundleError(f"{key} is {manifest.get(key)!r}, expected {expected!r}")
+    try:
+        if verify_checksums:
+            for name, checksum in manifest['checksums'].items():
+                if file_checksum(os.path.join(path, name)) != checksum:
+                    raise IndexBundleError(f"checksum mismatch for {name}")
+        index = faiss.read_index(os.path.join(path, BUNDLE_INDEX_FILE), INDEX_READ_FLAGS)
+        id_map = np.load(os.path.join(path, BUNDLE_IDS_FILE))
+        if BUNDLE_EMBEDDINGS_FILE in manifest['checksums']:
+            embeddings = np.load(os.path.join(path, BUNDLE_EMBEDDINGS_FILE), mmap_mode='r')
+        else:
+            embeddings = flat_index_vectors(index)
+    except (OSError, RuntimeError, ValueError) as e:
+        raise IndexBundleError(f"unreadable bundle file ({e})")
+    rows, dim = manifest['rows'], manifest['dimension']
+    if not isinstance(index, faiss.IndexIDMap2) or index.ntotal != rows or index.d != dim:
+        raise IndexBundleError(f"FAISS index doesn't match the manifest's {rows} x {dim} rows")
+    if embeddings is None or embeddings.shape != (rows, dim) or embeddings.dtype != np.float32 \
+            or id_map.shape != (rows,):
+        raise IndexBundleError(f"arrays don't match the manifest's {rows} x {dim} rows")
+    if index.metric_type != FAISS_METRIC:
+        raise IndexBundleError("FAISS index metric does not match SIMILARITY_METRIC")
+    return index, embeddings, id_map, manifest
+
+def read_index_delta(profile, base_version, version, dim):
+    path = os.path.join(bundle_dir(profile), base_version, f"{BUNDLE_DELTA_PREFIX}{version}.npz")
+    try:
+        # Every .npz member is CRC-checked as it is read
+        with np.load(path) as data:
+            id_map, embeddings, removed, updated = data['ids'], data['embeddings'], data['removed'], data['updated']
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise IndexBundleError(f"unreadable index delta ({e})")
+    if embeddings.shape != (len(id_map), dim) or embeddings.dtype != np.float32:
+        raise IndexBundleError(f"index delta doesn't match the bundle's {dim} dimensions")
+    return make_index_delta(id_map, embeddings, removed, updated)
+
+def read_published_snapshot(profile, current=None, verify_checksums=False):
+    """Read a profile's published bundle and delta into an IndexSnapshot (needs an app context).
+
+    If current already holds the published bundle, only the delta is read,
+    so following another worker's incremental updates costs the size of the
+    delta rather than the corpus. Raises like read_index_bundle.
+    """
+    published = published_bundle_version(profile)
+    if published is None:
+        raise FileNotFoundError(f"no {profile} index bundle has been published")
+    base_version, _, version = published.partition(' ')
+    if current is not None and current.index is not None and current.base_version == base_version:
+        snapshot = current
+    else:
+        index, embeddings, id_map, manifest = read_index_bundle(profile, base_version, verify_checksums)
+        apply_search_params(index)
+        snapshot = IndexSnapshot(index, id_map, embeddings, load_project_metadata(id_map), base_version,
+                                 manifest['index_spec'], manifest.get('built_at', 0.0), base_version, None)
+    if not version:
+        return snapshot._replace(version=base_version, delta=None)
+    delta = read_index_delta(profile, base_version, version, snapshot.index.d)
+    # Only the delta's projects need fresh metadata; re-reading them on every
+    # reload also repairs any earlier reload this process missed
+    records = fetch_projects(np.union1d(delta.id_map, delta.updated).tolist()).values()
+    return snapshot._replace(version=version, delta=delta, metadata=snapshot.metadata.with_records(records))
+
+def flat_index_vectors(index):
+    """The (ntotal, d) vectors of an IndexIDMap2 over a Flat index, or None for other types.
+
+    The array is a read-only view of the index's own storage (no copy), so it
+    is only valid while the index is alive; snapshots keep both together.
+    """
+    base = faiss.downcast_index(index.index)
+    if not isinstance(base, faiss.IndexFlat):
+        return None
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype='float32')
+    vectors = faiss.rev_swig_ptr(base.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+    vectors.setflags(write=False)
+    return vectors
+
+# --- Cross-worker index coordination ---
+# Every bundle write holds the profile's build lock: an flock on the bundle
+# directory plus, while Redis is reachable, a Redis lock renewed while held.
+# Writers reload the published bundle first, then publish and announce on
+# INDEX_CHANNEL; other workers reload it (or just its delta), polling CURRENT
+# when Redis is down.
+INDEX_CHANNEL = 'index:published'
+INDEX_LOCK_TTL = int(os.environ.get('INDEX_LOCK_TTL', 900))  # seconds before a dead leader's lock expires
+INDEX_LOCK_WAIT = int(os.environ.get('INDEX_LOCK_WAIT', 900))  # seconds to wait for another worker's build
+INDEX_WATCH_INTERVAL = float(os.environ.get('INDEX_WATCH_INTERVAL', 2.0))  # CURRENT polling period
+
+@contextmanager
+def index_build_lock(profile):
+    with file_build_lock(profile), redis_build_lock(profile):
+        yield
+
+@contextmanager
+def file_build_lock(profile):
+    if fcntl is None:
+        yield  # no file locking on this platform; only the Redis lock applies
+        return
+    os.makedirs(bundle_dir(profile), exist_ok=True)
+    with open(os.path.join(bundle_dir(profile), '.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
 
-# Build or load FAISS index and project id map
-faiss_index = None
-project_id_map = []  # index -> project_id
-project_embeddings = None
-
-def build_faiss_index():
-    global faiss_index, project_id_map, project_embeddings
-    projects = Project.query.all()
-    if not projects:
-        faiss_index = None
-        project_id_map = []
-        project_embeddings = None
+@contextmanager
+def redis_build_lock(profile):
+    lock = None
+    if cache.available:
+        try:
+            # Not thread-local: the renewer thread uses the same token
+            lock = cache.client.lock(f"index:build-lock:{profile}", timeout=INDEX_LOCK_TTL,
+                                     blocking_timeout=INDEX_LOCK_WAIT, thread_local=False)
+            acquired = lock.acquire()
+        except redis.RedisError as e:
+            logger.warning(f"Redis build lock unavailable ({e}), relying on the local file lock.")
+            lock = None
+        else:
+            if not acquired:
+                raise TimeoutError(f"Timed out waiting for another worker to finish building the {profile} index")
+    if lock is None:
+        yield
         return
-    embeddings = []
-    id_map = []
-    for proj in projects:
-        emb = compute_project_embedding(proj.title, proj.summary)
-        embeddings.append(emb)
-        id_map.append(proj.id)
-    embeddings = np.stack(embeddings).astype('float32')
-    index = faiss.IndexFlatL2(embeddings.shape[1])
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(INDEX_LOCK_TTL / 3):
+            try:
+                lock.reacquire()  # resets the TTL
+            except redis.RedisError as e:
+                logger.warning(f"Could not renew the {profile} build lock ({e}).")
+
+    renewer = threading.Thread(target=renew, daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        renewer.join()
+        try:
+            lock.release()
+        except redis.RedisError as e:
+            logger.warning(f"Could not release the {profile} build lock ({e}); it expires after {INDEX_LOCK_TTL}s.")
+
+def published_bundle_version(profile):
+    try:
+        with open(os.path.join(bundle_dir(profile), BUNDLE_CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def announce_index_change(message):
+    cache.publish(INDEX_CHANNEL, json.dumps({**message, 'pid': os.getpid()}))
+
+def reload_index_if_stale(profile):
+    """Swap in the published bundle if another process has replaced ours.
+
+    Returns True if a new snapshot was loaded. A bundle that can't be used is
+    logged and the current snapshot kept.
+    """
+    state = profile_indexes[profile]
+    version = published_bundle_version(profile)
+    if version is None or version == state.bundle_version:
+        return False
+    try:
+        with app.app_context():
+            snapshot = read_published_snapshot(profile, state.snapshot)
+    except (FileNotFoundError, IndexBundleError) as e:
+        logger.warning(f"Could not reload the published {profile} index bundle ({e}).")
+        return False
+    with index_lock:
+        publish_snapshot(profile, snapshot, save=False, from_bundle=True)
+    logger.info(f"Reloaded {profile} index bundle {bundle_key(snapshot)} published by another worker.")
+    return True
+
+class IndexWatcher:
+    """Keeps this process's loaded indexes in step with the published bundles.
+
+    Listens on INDEX_CHANNEL while Redis is available and otherwise polls the
+    CURRENT files every INDEX_WATCH_INTERVAL seconds; either way, loaded
+    profiles whose CURRENT moved are reloaded.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Threads don't survive fork; each worker watches for itself
+        self.lock = threading.Lock()
+        running, self.thread = self.thread is not None, None
+        if running:
+            self.start()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        pubsub = None
+        while True:
+            message = None
+            try:
+                if pubsub is None and cache.available:
+                    pubsub = cache.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(INDEX_CHANNEL)
+                if pubsub is not None:
+                    message = pubsub.get_message(timeout=self.interval)
+                else:
+                    time.sleep(self.interval)
+            except redis.RedisError:
+                pubsub = None
+                time.sleep(self.interval)
+            try:
+                self._handle(message)
+            except Exception:
+                logger.exception("Index watcher failed to apply an update.")
+
+    def _handle(self, message):
+        data = json.loads(message['data']) if message else {}
+        if data.get('pid') == os.getpid():
+            return
+        for profile in loaded_profiles():
+            reload_index_if_stale(profile)
+
+index_watcher = IndexWatcher(INDEX_WATCH_INTERVAL)
+
+# Build or load FAISS index and project id map
+# A profile's searchable state lives in an IndexSnapshot that is never changed
+# once published. Writers (rebuilds, incremental updates) build a new snapshot
+# off to the side and publish it with a single reference assignment, so
+# searches never take a lock and always see an index, id map and metadata
+# that belong together. index, id_map and embeddings are the base bundle
+# (base_version); incremental updates since then live in the delta.
+IndexSnapshot = namedtuple('IndexSnapshot', ['index', 'id_map', 'embeddings', 'metadata', 'version', 'spec', 'built_at',
+                                             'base_version', 'delta'])
+
+def empty_snapshot(built_at=0.0):
+    # built_at: wall-clock time the project table was read for the last full build
+    return IndexSnapshot(None, np.empty(0, dtype='int64'), None, None, new_index_version(), None, built_at, None, None)
+
+def bundle_key(snapshot):
+    # What CURRENT holds for a snapshot
+    if snapshot.delta is None:
+        return snapshot.base_version
+    return f"{snapshot.base_version} {snapshot.version}"
+
+def new_index_version():
+    # Stale similarity cache entries stop matching once the version changes
+    return uuid.uuid4().hex[:16]
+
+class ProfileIndex:
+    """The published IndexSnapshot of one embedding profile."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.encoders = EMBEDDING_PROFILES[profile]
+        self.snapshot = empty_snapshot()
+        self.bundle_version = None  # published bundle the snapshot was saved as or loaded from
+        self.loaded = False
+
+profile_indexes = {profile: ProfileIndex(profile) for profile in EMBEDDING_PROFILES}
+index_lock = threading.RLock()  # serializes writers; searches never take it
+last_drift_check = 0.0
+
+def loaded_profiles():
+    return [profile for profile, state in profile_indexes.items() if state.loaded]
+
+def publish_snapshot(profile, snapshot, save=True, from_bundle=False):
+    """Swap in a new snapshot for a profile (call with index_lock held).
+
+    save writes it out as the profile's bundle; from_bundle marks a snapshot
+    that was just read from the published bundle.
+    """
+    state = profile_indexes[profile]
+    snapshot.id_map.setflags(write=False)
+    state.snapshot = snapshot
+    if from_bundle:
+        state.bundle_version = bundle_key(snapshot)
+    if save and snapshot.index is not None:
+        if snapshot.delta is None:
+            write_index_bundle(profile, snapshot)
+        else:
+            write_index_delta(profile, snapshot)
+        state.bundle_version = bundle_key(snapshot)
+        announce_index_change({'profile': profile, 'version': snapshot.version})
+
+def encoder_scales(profile):
+    # Both the query and the project block are scaled, so a block's share of
+    # the inner product is scale², i.e. its weight over the total weight
+    encoders = EMBEDDING_PROFILES[profile]
+    total_weight = sum(ENCODER_WEIGHTS[encoder] for encoder in encoders)
+    return {encoder: float(np.sqrt(ENCODER_WEIGHTS[encoder] / total_weight)) for encoder in encoders}
+
+def profile_vectors(embeddings, profile):
+    """Map per-encoder embeddings into the vector space a profile's index searches.
+
+    The encoders' blocks are concatenated. In cosine mode each block is first
+    L2-normalized and scaled by sqrt(weight / total weight), so the inner
+    product of two vectors is the weighted mean of the per-encoder cosine
+    similarities. The embedding store keeps raw vectors, so changing weights
+    or metric never requires re-encoding, and the blocks are taken as they
+    come, so stored vectors are mapped without loading the models.
+    """
+    blocks = []
+    for encoder, scale in encoder_scales(profile).items():
+        block = np.array(embeddings[encoder], dtype='float32', ndmin=2)
+        if SIMILARITY_METRIC == 'cosine':
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            block = block / norms * scale
+        blocks.append(block)
+    return np.concatenate(blocks, axis=1)
+
+def distance_to_similarity(dist):
+    if SIMILARITY_METRIC == 'cosine':
+        return dist * 100  # inner product of normalized vectors is the cosine
+    # Convert L2 distance to a similarity percentage (approximate)
+    return 1 / (1 + dist) * 100
+
+
+def resolve_index_spec(index_type, dim, n):
+    spec = INDEX_TYPE_ALIASES.get(index_type.lower(), index_type)
+    # ~4*sqrt(n) lists, but never fewer than 39 training points per list
+    nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+    pq_m = next((m for m in (64, 56, 48, 32, 16, 8) if dim % m == 0), 1)
+    return spec.format(nlist=nlist, pq_m=pq_m)
+
+def create_faiss_index(vectors):
+    """Create and train an index of the configured type for the given vectors.
+
+    The trained index is wrapped in an IndexIDMap2 so vectors are stored and
+    returned by Project.id whatever the underlying index type. Returns the
+    index and the factory string it was built from.
+    """
+    dim = vectors.shape[1]
+    spec = resolve_index_spec(FAISS_INDEX_TYPE, dim, len(vectors))
+    try:
+        base = faiss.index_factory(dim, spec, FAISS_METRIC)
+        if not base.is_trained:
+            sample = vectors
+            if len(vectors) > FAISS_TRAIN_SAMPLE:
+                sample = vectors[np.sort(np.random.choice(len(vectors), FAISS_TRAIN_SAMPLE, replace=False))]
+            base.train(np.ascontiguousarray(sample))
+    except RuntimeError as e:
+        logger.warning(f"Could not build '{spec}' index for {len(vectors)} vectors ({e}), using Flat instead.")
+        spec = 'Flat'
+        base = faiss.index_factory(dim, spec, FAISS_METRIC)
+    index = faiss.IndexIDMap2(base)
+    apply_search_params(index)
+    return index, spec
+
+def apply_search_params(index):
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None:
+        ivf.nprobe = FAISS_NPROBE
+    if hasattr(base, 'hnsw'):
+        base.hnsw.efSearch = FAISS_EF_SEARCH
+
+def build_faiss_index(profile=None, requested_at=None):
+    """Rebuild a profile's index from the project table and publish it.
+
+    With requested_at (wall-clock time the rebuild was asked for), the build
+    is skipped if, once this process holds the build lock, the published
+    bundle was built from the table at or after that time by another worker.
+    """
+    state = profile_indexes[resolve_profile(profile)]
+    with index_build_lock(state.profile):
+        if requested_at is not None:
+            reload_index_if_stale(state.profile)
+            if state.snapshot.built_at >= requested_at:
+                logger.info(f"The {state.profile} index is already newer than the rebuild request, skipping it.")
+                state.loaded = True
+                return
+        build_profile_index(state)
+
+def iter_project_chunks(max_id, chunk_size=INDEX_BUILD_CHUNK, after_id=None):
+    """Yield (id, title, summary, domain) rows with after_id < id <= max_id, chunk by chunk.
+
+    Keyset pagination, so no cursor stays open while embeddings are saved
+    between chunks.
+    """
+    last_id = after_id
+    while True:
+        query = db.session.query(Project.id, Project.title, Project.summary, Project.domain).filter(Project.id <= max_id)
+        if last_id is not None:
+            query = query.filter(Project.id > last_id)
+        rows = query.order_by(Project.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+def build_profile_index(state):
+    """Embed the project table chunk by chunk into a new index (call with the build lock held).
+
+    Vectors go straight into a memory-mapped float32 matrix in the bundle
+    directory and the index is filled chunk by chunk, so apart from the
+    metadata cache, memory use doesn't grow with the corpus.
+    """
+    built_at = time.time()
+    prune_stored_embeddings()
+    count, max_id = db.session.query(db.func.count(Project.id), db.func.max(Project.id)).one()
+    os.makedirs(bundle_dir(state.profile), exist_ok=True)
+    fd, matrix_path = tempfile.mkstemp(prefix='.build-', suffix='.npy', dir=bundle_dir(state.profile))
+    os.close(fd)
+    try:
+        embeddings = None
+        id_map = np.empty(count, dtype='int64')
+        metadata_rows = []
+        filled = 0
+        for rows in iter_project_chunks(max_id or 0):
+            end = filled + len(rows)
+            vectors = profile_vectors(get_project_embeddings(rows, state.encoders), state.profile)
+            if embeddings is None:
+                # Sized from the first chunk, so fully stored corpora don't need the models loaded
+                embeddings = np.lib.format.open_memmap(matrix_path, mode='w+', dtype='float32',
+                                                       shape=(count, vectors.shape[1]))
+            embeddings[filled:end] = vectors
+            id_map[filled:end] = [row[0] for row in rows]
+            metadata_rows.extend(rows)
+            filled = end
+            logger.info(f"Embedded {filled}/{count} projects for the {state.profile} index.")
+        if not filled:  # empty table, or every row deleted since the count
+            with index_lock:
+                publish_snapshot(state.profile, empty_snapshot(built_at))
+            state.loaded = True
+            return
+        # Rows deleted since the count leave the tail unused
+        embeddings, id_map = embeddings[:filled], id_map[:filled]
+        index, spec = create_faiss_index(embeddings)
+        for start in range(0, filled, INDEX_BUILD_CHUNK):
+            index.add_with_ids(embeddings[start:start + INDEX_BUILD_CHUNK], id_map[start:start + INDEX_BUILD_CHUNK])
+        flat_vectors = flat_index_vectors(index)
+        if flat_vectors is not None:
+            embeddings = flat_vectors  # a Flat index already holds a copy; drop the scratch matrix
+        version = new_index_version()
+        snapshot = IndexSnapshot(index, id_map, embeddings, ProjectMetadata.from_rows(metadata_rows),
+                                 version, spec, built_at, version, None)
+        with index_lock:
+            publish_snapshot(state.profile, snapshot)
+    finally:
+        try:
+            # The snapshot keeps its mapping of the unlinked file on POSIX
+            os.remove(matrix_path)
+        except OSError:
+            pass  # still mapped on Windows; prune_index_bundles removes it later
+    state.loaded = True
+    if spec != 'Flat':
+        logger.info(f"FAISS index recall vs flat ({state.profile}): {measure_index_recall(profile=state.profile)}")
+
+def load_faiss_index(profile=None, build=True):
+    """Load a profile's saved bundle, building the index if there is none.
+
+    With build=False a missing or unusable bundle is left alone. Returns
+    whether an index was loaded.
+    """
+    profile = resolve_profile(profile)
+    state = profile_indexes[profile]
+    try:
+        # The version comes from the bundle, so it is stable across restarts and
+        # workers as long as the bundle is unchanged
+        snapshot = read_published_snapshot(profile, verify_checksums=INDEX_VERIFY_CHECKSUMS)
+    except FileNotFoundError:
+        logger.info(f"No index bundle for profile {profile}.")
+    except IndexBundleError as e:
+        if not INDEX_REBUILD_ON_MISMATCH:
+            raise
+        logger.warning(f"Index bundle for profile {profile} can't be used ({e}).")
+    else:
+        with index_lock:
+            publish_snapshot(profile, snapshot, save=False, from_bundle=True)
+        return True
+    if not build:
+        return False
+    logger.info(f"Building the {profile} index.")
+    with index_build_lock(profile):
+        # Workers starting together all miss the bundle; only the first builds it
+        if not reload_index_if_stale(profile):
+            build_profile_index(state)
+    return True
+
+def measure_index_recall(k=10, sample_size=200, profile=None):
+    """Recall@k of a profile's index against an exact flat search.
+
+    Queries are a random sample of the indexed project vectors, so this needs
+    no labelled data and can be run against the live index at any time.
+    """
+    if k < 1 or sample_size < 1:
+        raise ValueError("k and sample must be at least 1")
+    profile = resolve_profile(profile)
+    ensure_index_loaded(profile)
+    snapshot = profile_indexes[profile].snapshot
+    index, id_map, embeddings, spec = snapshot.index, snapshot.id_map, snapshot.embeddings, snapshot.spec
+    if index is None or len(id_map) == 0:
+        return None
+    k = min(k, len(id_map))
+    queries = embeddings[np.random.choice(len(id_map), min(sample_size, len(id_map)), replace=False)]
+    t0 = time.time()
+    _, ann_ids = index.search(queries, k)
+    t1 = time.time()
+    # Brute force straight over the (memory-mapped) matrix, without copying it into an index
+    _, exact_rows = faiss.knn(queries, embeddings, k, metric=FAISS_METRIC)
+    t2 = time.time()
+    exact_ids = id_map[exact_rows]
+    hits = sum(len(set(a) & set(e)) for a, e in zip(ann_ids.tolist(), exact_ids.tolist()))
+    return {
+        'profile': profile,
+        'index': spec,
+        'k': k,
+        'queries': len(queries),
+        'recall': hits / (k * len(queries)),
+        'ann_ms_per_query': (t1 - t0) * 1000 / len(queries),
+        'flat_ms_per_query': (t2 - t1) * 1000 / len(queries),
+    }
+
+# --- Incremental index maintenance ---
+# Project changes are applied to every loaded index once their transaction
+# commits. The base index is never modified; changes go into a small IndexDelta
+# layered over it, which a rebuild folds in after INDEX_DELTA_MAX entries.
+INDEX_DELTA_MAX = int(os.environ.get('INDEX_DELTA_MAX', 5000))
+
+IndexDelta = namedtuple('IndexDelta', ['index', 'id_map', 'embeddings', 'removed', 'updated'])
+
+def make_index_delta(id_map, embeddings, removed, updated=()):
+    # removed: sorted base ids hidden from searches; updated: ids whose
+    # metadata changed without re-embedding (e.g. domain edits)
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    index = faiss.IndexFlat(embeddings.shape[1], FAISS_METRIC)
     index.add(embeddings)
-    faiss_index = index
-    project_id_map = id_map
-    project_embeddings = embeddings
-    # Save to disk
-    faiss.write_index(index, FAISS_INDEX_FILE)
-    with open(EMBEDDINGS_FILE, 'wb') as f:
-        pickle.dump(embeddings, f)
-    with open(ID_MAP_FILE, 'wb') as f:
-        pickle.dump(id_map, f)
-
-def load_faiss_index():
-    global faiss_index, project_id_map, project_embeddings
+    id_map = np.asarray(id_map, dtype='int64')
+    id_map.setflags(write=False)
+    return IndexDelta(index, id_map, embeddings, np.asarray(removed, dtype='int64'), np.asarray(updated, dtype='int64'))
+
+def update_index_delta(snapshot, ids, embeddings=None, metadata_only=False):
+    """A snapshot's delta with ids replaced by embeddings, or removed if embeddings is None.
+
+    With metadata_only the ids are only marked as updated.
+    """
+    delta = snapshot.delta
+    if delta is None:
+        delta = make_index_delta(np.empty(0, dtype='int64'), np.empty((0, snapshot.index.d), dtype='float32'),
+                                 np.empty(0, dtype='int64'))
+    if metadata_only:
+        return delta._replace(updated=np.union1d(delta.updated, ids))
+    keep = ~np.isin(delta.id_map, ids)
+    id_map, vectors = delta.id_map[keep], delta.embeddings[keep]
+    if embeddings is not None:
+        id_map, vectors = np.concatenate([id_map, ids]), np.concatenate([vectors, embeddings])
+    # The metadata columns are row-aligned with the base id_map
+    in_base = [pid for pid in ids.tolist() if pid in snapshot.metadata.row_of]
+    removed = np.union1d(delta.removed, np.asarray(in_base, dtype='int64'))
+    return make_index_delta(id_map, vectors, removed, np.setdiff1d(delta.updated, ids))
+
+def index_delta_size(snapshot):
+    delta = snapshot.delta
+    return len(delta.id_map) + len(delta.removed) + len(delta.updated) if delta is not None else 0
+
+def snapshot_size(snapshot):
+    # Projects a search over the snapshot can return
+    if snapshot.index is None:
+        return 0
+    delta = snapshot.delta
+    if delta is None:
+        return snapshot.index.ntotal
+    return snapshot.index.ntotal - len(delta.removed) + len(delta.id_map)
+
+def snapshot_ids(snapshot):
+    delta = snapshot.delta
+    if delta is None:
+        return snapshot.id_map
+    return np.concatenate([snapshot.id_map[~np.isin(snapshot.id_map, delta.removed)], delta.id_map])
+
+def search_snapshot(snapshot, queries, k):
+    """Search a snapshot's base index and delta together, like Index.search.
+
+    Returns (distances, project ids) of the k best projects per query, best
+    first and padded with -1. Base rows the delta hides are dropped after
+    fetching that many extra base candidates.
+    """
+    delta = snapshot.delta
+    if delta is None:
+        return snapshot.index.search(queries, k)
+    base_k = min(k + len(delta.removed), snapshot.index.ntotal)
+    if base_k:
+        D, I = snapshot.index.search(queries, base_k)
+        I = np.where(np.isin(I, delta.removed), -1, I)
+    else:
+        D, I = np.empty((len(queries), 0), dtype='float32'), np.empty((len(queries), 0), dtype='int64')
+    if len(delta.id_map):
+        delta_D, rows = delta.index.search(queries, min(k, len(delta.id_map)))
+        D = np.concatenate([D, delta_D], axis=1)
+        I = np.concatenate([I, np.where(rows >= 0, delta.id_map[rows], -1)], axis=1)
+    # Inner product ranks high scores first, L2 small distances; empty slots go last
+    rank = np.where(I >= 0, -D if FAISS_METRIC == faiss.METRIC_INNER_PRODUCT else D, np.inf)
+    order = np.argsort(rank, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+def refresh_projects_in_index(project_ids):
+    """Bring the given projects up to date in the loaded indexes.
+
+    The rows are re-read from the table under each profile's build lock, so
+    when two commits touch the same project, whichever refresh runs last
+    embeds and publishes the latest row. Projects no longer in the table are
+    removed. Each profile's delta is copied and updated off to the side, then
+    published as a new snapshot.
+    """
+    if not project_ids:
+        return
+    ids = np.asarray(sorted(project_ids), dtype='int64')
+    for profile in loaded_profiles():
+        with index_build_lock(profile), index_lock:
+            # Start from the latest published bundle, which may come from another worker
+            reload_index_if_stale(profile)
+            current = profile_indexes[profile].snapshot
+            rows = list(fetch_projects(ids.tolist()).values())
+            present = np.asarray([row[0] for row in rows], dtype='int64')
+            embeddings = profile_vectors(get_project_embeddings(rows, EMBEDDING_PROFILES[profile]), profile) \
+                if rows else None
+            if current.index is None:
+                if rows:
+                    # Nothing to layer a delta over yet; these rows become the first bundle
+                    index, spec = create_faiss_index(embeddings)
+                    index.add_with_ids(embeddings, present)
+                    version = new_index_version()
+                    publish_snapshot(profile, IndexSnapshot(index, present, embeddings, ProjectMetadata.from_rows(rows),
+                                                            version, spec, current.built_at, version, None))
+                continue
+            snapshot = current
+            gone = np.setdiff1d(ids, present)
+            if len(gone):
+                snapshot = snapshot._replace(delta=update_index_delta(snapshot, gone))
+            if rows:
+                snapshot = snapshot._replace(delta=update_index_delta(snapshot, present, embeddings),
+                                             metadata=snapshot.metadata.with_records(rows))
+            publish_snapshot(profile, snapshot._replace(version=new_index_version()))
+
+def update_project_metadata(project_ids):
+    """Publish field edits that don't affect the embedding (e.g. domain).
+
+    The rows are re-read from the table and their ids recorded in the delta,
+    so other workers refresh them when they reload it, however they notice
+    the new version.
+    """
+    if not project_ids:
+        return
+    for profile in loaded_profiles():
+        with index_build_lock(profile), index_lock:
+            reload_index_if_stale(profile)
+            current = profile_indexes[profile].snapshot
+            if current.index is None:
+                continue
+            rows = [row for row in fetch_projects(list(project_ids)).values() if current.metadata.knows(row.id)]
+            if not rows:
+                continue
+            ids = np.asarray([row.id for row in rows], dtype='int64')
+            publish_snapshot(profile, current._replace(
+                delta=update_index_delta(current, ids, metadata_only=True),
+                metadata=current.metadata.with_records(rows),
+                version=new_index_version(),
+            ))
+
+def apply_index_changes(upserts, removals, metadata_updates=()):
+    # Arguments are sets of project ids
     try:
-        faiss_index = faiss.read_index(FAISS_INDEX_FILE)
-        with open(EMBEDDINGS_FILE, 'rb') as f:
-            project_embeddings = pickle.load(f)
-        with open(ID_MAP_FILE, 'rb') as f:
-            project_id_map = pickle.load(f)
+        ensure_index_loaded()
+        with app.app_context():
+            update_project_metadata(metadata_updates)
+            refresh_projects_in_index(upserts | removals)
     except Exception:
-        build_faiss_index()
+        logger.exception("Incremental FAISS update failed, falling back to a full rebuild.")
+        rebuild_faiss_index_async()
+        return
+    if rebuild_scheduler.running:
+        # A rebuild that read the project table before this commit would
+        # publish over the change; queue another one to pick it up
+        rebuild_faiss_index_async()
+    elif any(index_delta_size(profile_indexes[profile].snapshot) > INDEX_DELTA_MAX for profile in loaded_profiles()):
+        # Fold the delta into a new base bundle (from stored embeddings, no re-encoding)
+        rebuild_faiss_index_async()
+
+@event.listens_for(Project, 'after_insert')
+@event.listens_for(Project, 'after_update')
+def queue_project_upsert(mapper, connection, target):
+    state = inspect(target)
+    session = object_session(target)
+    # Only ids are kept; the rows are re-read once the index is updated
+    if state.attrs.title.history.has_changes() or state.attrs.summary.history.has_changes():
+        session.info.setdefault('index_upserts', set()).add(target.id)
+    else:
+        # domain-only edits don't change the embedding
+        session.info.setdefault('metadata_updates', set()).add(target.id)
+
+@event.listens_for(Project, 'after_delete')
+def queue_project_removal(mapper, connection, target):
+    session = object_session(target)
+    session.info.setdefault('index_removals', set()).add(target.id)
+    session.info.get('index_upserts', set()).discard(target.id)
+    session.info.get('metadata_updates', set()).discard(target.id)
+
+@event.listens_for(db.session, 'after_commit')
+def apply_committed_project_changes(session):
+    upserts = session.info.pop('index_upserts', set())
+    removals = session.info.pop('index_removals', set())
+    metadata_updates = session.info.pop('metadata_updates', set()) - upserts
+    if upserts or removals or metadata_updates:
+        threading.Thread(target=apply_index_changes, args=(upserts, removals, metadata_updates), daemon=True).start()
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_project_changes(session):
+    session.info.pop('index_upserts', None)
+    session.info.pop('index_removals', None)
+    session.info.pop('metadata_updates', None)
+
+def index_has_drifted(profile=None):
+    # Catches writes that bypass the ORM (e.g. import_projects.py)
+    id_map = snapshot_ids(profile_indexes[resolve_profile(profile)].snapshot)
+    count, max_id = db.session.query(db.func.count(Project.id), db.func.max(Project.id)).one()
+    indexed_count = len(id_map)
+    indexed_max = int(id_map.max()) if len(id_map) else None
+    return count != indexed_count or max_id != indexed_max
+
+def rebuild_faiss_index_if_drifted():
+    global last_drift_check
+    now = time.time()
+    if now - last_drift_check < INDEX_DRIFT_CHECK_INTERVAL:
+        return
+    profiles = loaded_profiles()
+    if not profiles:
+        return  # nothing to compare against until an index is loaded
+    last_drift_check = now
+    if any(index_has_drifted(profile) for profile in profiles):
+        logger.info("Project table and FAISS index are out of sync, scheduling a rebuild.")
+        rebuild_faiss_index_async()
+
+# Indexes are loaded by the warm-up thread (default profile) or by the first
+# request needing them
+index_load_lock = threading.Lock()
+warmup_error = None
+
+def ensure_index_loaded(profile=None, build=True, watch=True):
+    # watch=False loads without starting the IndexWatcher (e.g. in the gunicorn master)
+    state = profile_indexes[resolve_profile(profile)]
+    if state.loaded:
+        return
+    with index_load_lock:
+        if not state.loaded:
+            with app.app_context():
+                if load_faiss_index(state.profile, build):
+                    state.loaded = True
+    if watch:
+        index_watcher.start()
+
+def warm_up(build=True, check_parity=True, watch=True):
+    """Load the encoders and the default profile's FAISS index.
+
+    build=False only loads a saved bundle; building one runs the encoders.
+    """
+    global warmup_error
+    t0 = time.time()
+    try:
+        get_encoder_backend()
+        ensure_index_loaded(build=build, watch=watch)
+    except Exception as e:
+        warmup_error = str(e)
+        logger.exception("Warm-up failed; models and index will load on first use.")
+        return
+    if not profile_indexes[EMBEDDING_PROFILE].loaded:
+        logger.info(f"Models ready after {time.time() - t0:.1f}s; the FAISS index is not built yet.")
+        return
+    logger.info(f"Models and FAISS index ready after {time.time() - t0:.1f}s.")
+    if check_parity and INFERENCE_BACKEND != 'torch':
+        with app.app_context():
+            logger.info(f"Inference backend parity: {backend_parity_report()}")
+
+def migrate_project_content_hash():
+    """Add and backfill project.content_hash in databases created before it existed."""
+    with db.engine.begin() as conn:
+        columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(project)")}
+        added = 'content_hash' not in columns
+        if added:
+            conn.exec_driver_sql("ALTER TABLE project ADD COLUMN content_hash VARCHAR(64)")
+        rows = conn.exec_driver_sql("SELECT id, title, summary FROM project WHERE content_hash IS NULL ORDER BY id").fetchall()
+        if rows:
+            seen = {row[0] for row in conn.exec_driver_sql("SELECT content_hash FROM project WHERE content_hash IS NOT NULL")}
+            updates = []
+            for pid, title, summary in rows:
+                content_hash = project_content_hash(title, summary)
+                if content_hash not in seen:
+                    seen.add(content_hash)
+                    updates.append((content_hash, pid))
+            if updates:
+                conn.exec_driver_sql("UPDATE project SET content_hash = ? WHERE id = ?", updates)
+            if added and len(updates) < len(rows):
+                # Left unhashed rather than deleted; they are copies of earlier rows
+                logger.warning(f"{len(rows) - len(updates)} duplicate projects have no content hash.")
+        conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_project_content_hash ON project (content_hash)")
 
 # Call this on app startup
 with app.app_context():
     db.create_all()
-    load_faiss_index()
+    migrate_project_content_hash()
 
-# Call this after any project add/update/delete
-# build_faiss_index()
+def reset_db_after_fork():
+    # Pooled SQLite connections opened in the parent must not be reused by a worker
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def reset_index_locks_after_fork():
+    # A lock some parent thread held at fork time would stay held in the child
+    global index_lock, index_load_lock
+    index_lock = threading.RLock()
+    index_load_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_db_after_fork)
+    os.register_at_fork(after_in_child=reset_index_locks_after_fork)
+
+def configure_torch_threads(num_threads):
+    # One intra-op pool per worker process; avoids workers oversubscribing the CPU
+    import torch
+    torch.set_num_threads(num_threads)
+
+def create_app():
+    """WSGI app factory for production servers (see wsgi.py / gunicorn.conf.py).
+
+    Loads the encoder weights and the default profile's saved index bundle
+    before returning, so a pre-forking server loads them once in the master
+    and workers share them copy-on-write. Nothing here runs inference, since
+    torch is not fork-safe once it has: a missing bundle is built by the
+    workers (see finish_warm_up) and the backend parity check is left to
+    /api/inference/parity. The master stays passive after loading: the
+    IndexWatcher only runs in the workers.
+    """
+    warm_up(build=False, check_parity=False, watch=False)
+    # Keep the loaded objects out of future GC passes, which would otherwise
+    # touch (and un-share) their pages in every worker
+    gc.freeze()
+    return app
+
+def finish_warm_up():
+    # Called in each forked worker: watches for new bundles and builds the
+    # index if the master found none
+    index_watcher.start()
+    threading.Thread(target=warm_up, kwargs={'check_parity': False}, daemon=True).start()
 
 # Refactor calculate_similarity to use FAISS
-
-def calculate_similarity(title, summary):
+MAX_BATCH_PROPOSALS = 500  # proposals accepted per /api/similarity/batch request
+DEFAULT_TOP_K = 2
+MAX_TOP_K = 50
+SEARCH_OVERFETCH = 4  # initial candidates fetched per requested match
+
+def fetch_projects(project_ids, metadata=None):
+    """ProjectRecords by id, served from a snapshot's metadata cache.
+
+    Only ids the cache doesn't know (e.g. rows added outside the ORM since the
+    last rebuild) fall back to chunked IN queries.
+    """
+    projects = {}
+    missing = []
+    for proj_id in project_ids:
+        record = metadata.get(proj_id) if metadata is not None else None
+        if record is not None:
+            projects[proj_id] = record
+        else:
+            missing.append(proj_id)
+    for start in range(0, len(missing), STORE_QUERY_CHUNK):
+        chunk = missing[start:start + STORE_QUERY_CHUNK]
+        rows = db.session.query(Project.id, Project.title, Project.summary, Project.domain).filter(Project.id.in_(chunk))
+        projects.update({row[0]: ProjectRecord(*row) for row in rows})
+    return projects
+
+SIMILARITY_CACHE_TTL = 3600
+
+def normalize_cache_text(text):
+    return ' '.join(preprocess_text(text).split())
+
+def similarity_cache_key(title, summary, k, min_similarity, domain, profile, version):
+    # Fixed-length key; the index version retires entries after any index change
+    payload = json.dumps([
+        profile_embedding_key(profile), SIMILARITY_METRIC, version,
+        normalize_cache_text(title), normalize_cache_text(summary),
+        k, min_similarity, normalize_cache_text(domain or ''),
+    ])
+    return f"similarity:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+def select_matches(hits, projects, k, min_similarity, domain):
+    """Filter ranked (project_id, similarity) hits down to k unique matches.
+
+    Returns the matches and whether the candidate list was cut short by the
+    similarity threshold (hits are ranked, so fetching more cannot help).
+    """
+    unique_titles = set()
+    matches = []
+    for proj_id, similarity in hits:
+        if min_similarity is not None and similarity < min_similarity:
+            return matches, True
+        proj = projects.get(proj_id)
+        if proj is None or proj.title in unique_titles:
+            continue
+        if domain and proj.domain.lower() != domain.lower():
+            continue
+        matches.append((proj, similarity))
+        unique_titles.add(proj.title)
+        if len(matches) == k:
+            return matches, True
+    return matches, False
+
+def calculate_similarities(queries, k=DEFAULT_TOP_K, min_similarity=None, domains=None, profile=None):
+    """Top k matches for many (title, summary) queries.
+
+    Cache misses are embedded in one batched forward pass and looked up with a
+    single multi-query FAISS search; matched projects are loaded together.
+    Each search over-fetches candidates so title dedup and the similarity and
+    domain filters still leave k results, doubling the fetch size for any
+    query that comes up short. The profile picks the encoders and the index
+    searched (default EMBEDDING_PROFILE).
+    """
     t0 = time.time()
-    cache_key = f"similarity_{title}_{summary}"
-    if cache and cache.ping():
-        cached_result = cache.get(cache_key)
+    profile = resolve_profile(profile)
+    ensure_index_loaded(profile)
+    # One snapshot serves the whole call, even if a rebuild publishes a new one
+    snapshot = profile_indexes[profile].snapshot
+    domains = domains or [None] * len(queries)
+    cache_keys = [similarity_cache_key(title, summary, k, min_similarity, domains[i], profile, snapshot.version)
+                  for i, (title, summary) in enumerate(queries)]
+    results = [None] * len(queries)
+    for i, cached_result in enumerate(cache.get_many(cache_keys)):
         if cached_result:
+            # Entries hold the full match payload, so a hit needs no lookups
             cached_data = json.loads(cached_result.decode('utf-8'))
-            top_two = []
-            for item in cached_data:
-                proj = Project.query.get(item['id'])
-                if proj:
-                    top_two.append((proj, item['similarity']))
-            return top_two
-
-    # Compute embedding for user input
-    user_emb = compute_project_embedding(title, summary).astype('float32')
-    if faiss_index is None or len(project_id_map) == 0:
-        return []
-    D, I = faiss_index.search(user_emb.reshape(1, -1), 2)  # top 2
-    t1 = time.time()
-    print(f"SBERT encode: {t1 - t0:.3f}s, FAISS search: {D[0][0]:.3f}s, Total: {t1 - t0:.3f}s")
-    top_two = []
-    for idx, dist in zip(I[0], D[0]):
-        if idx < 0 or idx >= len(project_id_map):
-            continue
-        proj_id = project_id_map[idx]
-        proj = Project.query.get(proj_id)
-        if proj:
-            # Convert L2 distance to cosine similarity percentage (approximate)
-            # Here, we use: similarity = 1 / (1 + dist) * 100
-            similarity = 1 / (1 + dist) * 100
-            top_two.append((proj, similarity))
-
-    # After finding top_two, filter out duplicates by title
-    unique_titles = set()
-    unique_top_two = []
-    for proj, similarity in top_two:
-        if proj.title not in unique_titles:
-            unique_top_two.append((proj, similarity))
-            unique_titles.add(proj.title)
-        if len(unique_top_two) == 2:
-            break
-    top_two = unique_top_two
-
-    if cache and cache.ping():
-        cache_data = [{'id': proj.id, 'similarity': float(similarity)} for proj, similarity in top_two]
-        cache.set(cache_key, json.dumps(cache_data), ex=3600)
-    return top_two
+            results[i] = [(ProjectRecord(item['id'], item['title'], item['summary'], item['domain']), item['similarity'])
+                          for item in cached_data]
+    misses = [i for i, hits in enumerate(results) if hits is None]
+
+    projects = {}
+    if misses:
+        # Compute embeddings for user input
+        user_embs = profile_vectors(compute_encoder_embeddings(
+            [queries[i][0] for i in misses], [queries[i][1] for i in misses], EMBEDDING_PROFILES[profile]), profile)
+        t1 = time.time()
+        pending = list(range(len(misses)))  # rows of user_embs still short of k matches
+        fetch = k * SEARCH_OVERFETCH
+        ntotal = snapshot_size(snapshot)
+        while pending and ntotal:
+            fetch = min(fetch, ntotal)
+            D, I = search_snapshot(snapshot, user_embs[pending], fetch)
+            projects.update(fetch_projects({int(pid) for pid in I.ravel() if pid >= 0} - projects.keys(), snapshot.metadata))
+            still_pending = []
+            for row, emb_row in enumerate(pending):
+                i = misses[emb_row]
+                hits = [(int(pid), distance_to_similarity(dist)) for pid, dist in zip(I[row], D[row]) if pid >= 0]
+                results[i], complete = select_matches(hits, projects, k, min_similarity, domains[i])
+                if not complete and fetch < ntotal:
+                    still_pending.append(emb_row)
+            pending = still_pending
+            fetch *= 2
+        t2 = time.time()
+        print(f"Encode: {t1 - t0:.3f}s, FAISS search: {t2 - t1:.3f}s, Queries: {len(misses)}/{len(queries)}, Profile: {profile}")
+
+    for i in misses:
+        results[i] = results[i] or []
+    cache.set_many({
+        cache_keys[i]: json.dumps([match_to_dict(proj, similarity) for proj, similarity in results[i]])
+        for i in misses
+    }, ex=SIMILARITY_CACHE_TTL)
+    return results
+
+def calculate_similarity(title, summary, k=DEFAULT_TOP_K, min_similarity=None, domain=None, profile=None):
+    return calculate_similarities([(title, summary)], k, min_similarity, [domain], profile)[0]
+
+def parse_search_params(data):
+    """Read k, min_similarity, match_domain and profile from a request body."""
+    k = int(data.get('k', DEFAULT_TOP_K))
+    if not 1 <= k <= MAX_TOP_K:
+        raise ValueError(f"k must be between 1 and {MAX_TOP_K}")
+    min_similarity = data.get('min_similarity')
+    if min_similarity is not None:
+        min_similarity = float(min_similarity)
+    return k, min_similarity, bool(data.get('match_domain', False)), resolve_profile(data.get('profile'))
+
+def match_to_dict(proj, similarity):
+    return {
+        'id': proj.id,
+        'title': proj.title,
+        'summary': proj.summary,
+        'domain': proj.domain,
+        'similarity': float(similarity)
+    }
+
+# --- Rebuild scheduling ---
+# Full rebuilds are requested from many places (drift checks, failed
+# incremental updates, the rebuild endpoint). They all go through one
+# long-lived scheduler thread that coalesces bursts into a single rebuild.
+INDEX_REBUILD_DEBOUNCE = float(os.environ.get('INDEX_REBUILD_DEBOUNCE', 2.0))  # seconds without new requests
+INDEX_REBUILD_MAX_DELAY = float(os.environ.get('INDEX_REBUILD_MAX_DELAY', 30.0))  # longest wait through a burst
+
+class RebuildScheduler:
+    """Runs rebuild_fn on a single worker thread, coalescing requests.
+
+    request() sets a dirty flag and returns a generation number at once. The
+    worker waits until no request has come in for `debounce` seconds, or
+    `max_delay` seconds have passed since the first pending one, then clears
+    the flag and rebuilds. A request arriving mid-rebuild sets the flag again
+    and gets its own rebuild afterwards, so no request is dropped. Once a
+    rebuild finishes, `completed` holds the generation it covered; wait()
+    blocks until a given generation is covered. rebuild_fn is passed the
+    wall-clock time of the oldest request it covers.
+    """
+
+    def __init__(self, rebuild_fn, debounce, max_delay):
+        self.rebuild_fn = rebuild_fn
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.cond = threading.Condition()
+        self.dirty = False
+        self.running = False
+        self.first_request = 0.0
+        self.first_request_time = 0.0  # wall clock, shared with other workers via the bundle
+        self.last_request = 0.0
+        self.retry_at = 0.0  # set after a failed rebuild
+        self.requested = 0  # generation of the latest request
+        self.completed = 0  # generation covered by the last successful rebuild
+        self.worker = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Threads don't survive fork; pending work restarts the worker
+        self.cond = threading.Condition()
+        self.running = False
+        self.worker = None
+        if self.dirty:
+            self._ensure_worker()
+
+    def request(self):
+        with self.cond:
+            now = time.monotonic()
+            self.requested += 1
+            if not self.dirty:
+                self.dirty = True
+                self.first_request = now
+                self.first_request_time = time.time()
+            self.last_request = now
+            self._ensure_worker()
+            self.cond.notify_all()
+            return self.requested
+
+    def wait(self, generation, timeout=None):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.completed >= generation, timeout)
+
+    def status(self):
+        with self.cond:
+            return {
+                'requested_generation': self.requested,
+                'completed_generation': self.completed,
+                'pending': self.dirty,
+                'running': self.running,
+            }
+
+    def _ensure_worker(self):
+        # Called with self.cond held
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self._run, daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.dirty:
+                        now = time.monotonic()
+                        due = max(min(self.last_request + self.debounce, self.first_request + self.max_delay), self.retry_at)
+                        if now >= due:
+                            break
+                        self.cond.wait(due - now)
+                    else:
+                        self.cond.wait()
+                self.dirty = False
+                self.running = True
+                generation = self.requested
+                requested_at = self.first_request_time
+            try:
+                self.rebuild_fn(requested_at)
+            except Exception:
+                logger.exception(f"FAISS index rebuild failed, retrying in {self.max_delay:.0f}s.")
+                with self.cond:
+                    self.running = False
+                    if not self.dirty:
+                        self.dirty = True
+                        self.first_request = self.last_request = time.monotonic()
+                    self.first_request_time = requested_at
+                    self.retry_at = time.monotonic() + self.max_delay
+                continue
+            with self.cond:
+                self.running = False
+                self.retry_at = 0.0
+                self.completed = generation
+                self.cond.notify_all()
+
+def rebuild_loaded_indexes(requested_at=None):
+    with app.app_context():
+        for profile in loaded_profiles() or [EMBEDDING_PROFILE]:
+            build_faiss_index(profile, requested_at)
 
-index_rebuild_lock = threading.Lock()
-index_rebuild_running = False
+rebuild_scheduler = RebuildScheduler(rebuild_loaded_indexes, INDEX_REBUILD_DEBOUNCE, INDEX_REBUILD_MAX_DELAY)
 
 def rebuild_faiss_index_async():
-    def wrapped():
-        global index_rebuild_running
-        with index_rebuild_lock:
-            if index_rebuild_running:
-                print("FAISS index rebuild already running, skipping this request.")
-                return  # Skip if already running
-            index_rebuild_running = True
-        try:
-            with app.app_context():
-                build_faiss_index()
-        finally:
-            with index_rebuild_lock:
-                index_rebuild_running = False
-    thread = threading.Thread(target=wrapped)
-    thread.start()
+    """Schedule a full rebuild of the loaded indexes; returns its generation."""
+    return rebuild_scheduler.request()
 
 # Routes
 @app.route('/')
 def home():
     return jsonify({"message": "Welcome to the API. Use /login to authenticate."})
 
+@app.route('/ready')
+def ready():
+    # Readiness probe: 200 once the encoders and the FAISS index are loaded
+    status = {
+        "models": encoder_backend is not None,
+        "index": profile_indexes[EMBEDDING_PROFILE].loaded,
+    }
+    code = 200 if all(status.values()) else 503
+    body = {"ready": code == 200, **status}
+    if warmup_error:
+        body["error"] = warmup_error
+    return jsonify(body), code
+
 @app.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -468,9 +2415,13 @@ def index(current_user):
     summary = data.get('summary', '').strip()
     domain = data.get('domain', '').strip()
     history_id = data.get('historyId', None)  # Get the historyId from the request
+    try:
+        k, min_similarity, match_domain, profile = parse_search_params(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
 
     # Calculate similarity between the new project and existing projects
-    top_matches = calculate_similarity(title, summary)
+    top_matches = calculate_similarity(title, summary, k, min_similarity, domain if match_domain else None, profile)
     route_end = time.time()
     print(f"/index route after similarity: {route_end - request_start:.3f}s")
 
@@ -505,7 +2456,7 @@ def index(current_user):
             })
             request_end = time.time()
             print(f"/index route total time (update): {request_end - request_start:.3f}s")
-            rebuild_faiss_index_async()  # Rebuild index in background
+            rebuild_faiss_index_if_drifted()
             return response
         else:
             return jsonify({"error": "History not found"}), 404  # If no history entry is found
@@ -539,7 +2490,7 @@ def index(current_user):
         })
         request_end = time.time()
         print(f"/index route total time (create): {request_end - request_start:.3f}s")
-        rebuild_faiss_index_async()  # Rebuild index in background
+        rebuild_faiss_index_if_drifted()
         return response
 
 @app.route('/contact', methods=['POST'])
@@ -616,16 +2567,86 @@ def api_similarity(current_user):
     title = data.get('title', '').strip()
     summary = data.get('summary', '').strip()
     domain = data.get('domain', '').strip()
-    top_matches = calculate_similarity(title, summary)
-    results = [{
-        'id': proj.id,
-        'title': proj.title,
-        'summary': proj.summary,
-        'domain': proj.domain,
-        'similarity': float(similarity)
-    } for proj, similarity in top_matches]
+    try:
+        k, min_similarity, match_domain, profile = parse_search_params(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    top_matches = calculate_similarity(title, summary, k, min_similarity, domain if match_domain else None, profile)
+    results = [match_to_dict(proj, similarity) for proj, similarity in top_matches]
     return jsonify({"matches": results})
 
+@app.route('/api/similarity/batch', methods=['POST'])
+@token_required
+def api_similarity_batch(current_user):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    proposals = data.get('proposals')
+    if not isinstance(proposals, list) or not proposals:
+        return jsonify({"error": "proposals must be a non-empty list"}), 400
+    if len(proposals) > MAX_BATCH_PROPOSALS:
+        return jsonify({"error": f"At most {MAX_BATCH_PROPOSALS} proposals per request"}), 400
+    for i, p in enumerate(proposals):
+        if not isinstance(p, dict):
+            return jsonify({"error": f"proposals[{i}] must be an object"}), 400
+        for field in ('title', 'summary', 'domain'):
+            if not isinstance(p.get(field, ''), str):
+                return jsonify({"error": f"proposals[{i}].{field} must be a string"}), 400
+    try:
+        k, min_similarity, match_domain, profile = parse_search_params(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    queries = [(p.get('title', '').strip(), p.get('summary', '').strip()) for p in proposals]
+    domains = [p.get('domain', '').strip() if match_domain else None for p in proposals]
+    all_matches = calculate_similarities(queries, k, min_similarity, domains, profile)
+    results = [{
+        'title': title,
+        'matches': [match_to_dict(proj, similarity) for proj, similarity in top_matches]
+    } for (title, _), top_matches in zip(queries, all_matches)]
+    return jsonify({"results": results})
+
+@app.route('/api/index/rebuild', methods=['POST'])
+@token_required
+def api_rebuild_index(current_user):
+    generation = rebuild_faiss_index_async()
+    return jsonify({"message": "Index rebuild scheduled", "generation": generation}), 202
+
+@app.route('/api/index/rebuild', methods=['GET'])
+@token_required
+def api_rebuild_status(current_user):
+    profiles = {profile: {
+        'version': profile_indexes[profile].snapshot.version,
+        'bundle_version': profile_indexes[profile].bundle_version,
+        'published_version': published_bundle_version(profile),
+    } for profile in loaded_profiles()}
+    return jsonify({**rebuild_scheduler.status(), 'profiles': profiles})
+
+@app.route('/api/index/recall', methods=['GET'])
+@token_required
+def api_index_recall(current_user):
+    k = request.args.get('k', 10, type=int)
+    sample_size = request.args.get('sample', 200, type=int)
+    try:
+        report = measure_index_recall(k=k, sample_size=sample_size, profile=request.args.get('profile'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if report is None:
+        return jsonify({"error": "Index is empty"}), 404
+    return jsonify(report)
+
+@app.route('/api/inference/parity', methods=['GET'])
+@token_required
+def api_inference_parity(current_user):
+    report = backend_parity_report()
+    if report is None:
+        return jsonify({"error": "No projects to compare on"}), 404
+    return jsonify(report)
+
+@app.route('/api/cache/stats', methods=['GET'])
+@token_required
+def api_cache_stats(current_user):
+    return jsonify({"embeddings": embedding_cache.stats(), "redis_available": cache.available})
+
 @app.route('/feedback', methods=['POST'])
 @token_required
 def feedback(current_user):
@@ -662,7 +2683,13 @@ def feedback(current_user):
 def help():
     return jsonify({"message": "Available: /login, /logout, /signup, /index, /history, /user"})
 
+if MODEL_WARMUP == 'eager':
+    warm_up()
+elif MODEL_WARMUP == 'background':
+    threading.Thread(target=warm_up, daemon=True).start()
+
 if __name__ == '__main__':
+    # Development server only; use wsgi.py with gunicorn in production
     with app.app_context():
         db.create_all()
-    app.run(host='localhost', port=5000, debug=True)
+    app.run(host='localhost', port=5000, debug=os.environ.get('FLASK_DEBUG', '1') == '1')
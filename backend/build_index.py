@@ -0,0 +1,136 @@
+"""Build a FAISS index bundle offline, outside the web server.
+
+    python build_index.py [--profile sbert+t5] [--workers 4] [--chunk-size 2000]
+
+Projects are embedded in chunks by a pool of processes, each with its own
+copy of the models, running at a lower CPU priority than the web server.
+Every finished chunk is saved to the embedding store, so an interrupted build
+resumes where it stopped when run again. The index is then built from the
+store and published as a new bundle; running web workers pick it up when it
+is announced.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Models are only loaded in the pool workers, on first use
+os.environ.setdefault('MODEL_WARMUP', 'lazy')
+os.environ.setdefault('INFERENCE_BATCHING', '0')
+
+from app import (EMBEDDING_PROFILE, EMBEDDING_PROFILES, INDEX_BUILD_CHUNK, Project, app, build_faiss_index,
+                 compute_encoder_embeddings, configure_torch_threads, db, embedding_content_hash,
+                 iter_project_chunks, load_stored_embeddings, profile_indexes, prune_stored_embeddings,
+                 resolve_profile, save_stored_embeddings)
+
+
+def init_worker(threads):
+    # Workers inherit the lowered priority from the parent process
+    configure_torch_threads(threads)
+
+
+def embed_chunk(encoder, rows):
+    # rows are (id, content_hash, title, summary); returns store entries
+    vectors = compute_encoder_embeddings([row[2] for row in rows], [row[3] for row in rows],
+                                         (encoder,), use_cache=False)[encoder]
+    return encoder, [(row[0], row[1], emb) for row, emb in zip(rows, vectors)]
+
+
+def stale_rows(rows, encoder):
+    stored = load_stored_embeddings(encoder, [row[0] for row in rows])
+    stale = []
+    for pid, title, summary, _ in rows:
+        content_hash = embedding_content_hash(title, summary, encoder)
+        hit = stored.get(pid)
+        if not hit or hit[0] != content_hash:
+            stale.append((pid, content_hash, title, summary))
+    return stale
+
+
+class Progress:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.reused = 0
+        self.started = time.time()
+        self.embedded = 0
+
+    def add(self, embedded=0, reused=0):
+        self.embedded += embedded
+        self.reused += reused
+        self.done += embedded + reused
+        rate = self.embedded / max(time.time() - self.started, 1e-9)
+        eta = (self.total - self.done) / rate if rate else 0
+        print(f"[{self.done}/{self.total}] {self.reused} reused, {rate:.1f} embeddings/s, "
+              f"about {eta:.0f}s left", flush=True)
+
+
+def save_finished(pending, progress):
+    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        encoder, entries = future.result()
+        save_stored_embeddings(encoder, entries)
+        progress.add(embedded=len(entries))
+    return pending
+
+
+def embed_corpus(profile, workers, chunk_size, threads):
+    """Bring the embedding store up to date for every encoder of the profile."""
+    encoders = EMBEDDING_PROFILES[profile]
+    count, max_id = db.session.query(db.func.count(Project.id), db.func.max(Project.id)).one()
+    if not count:
+        return
+    progress = Progress(count * len(encoders))
+    context = multiprocessing.get_context('spawn')  # torch is not fork-safe once initialised
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker,
+                             initargs=(threads,)) as pool:
+        pending = set()
+        try:
+            for rows in iter_project_chunks(max_id, chunk_size):
+                for encoder in encoders:
+                    stale = stale_rows(rows, encoder)
+                    if len(stale) < len(rows):
+                        progress.add(reused=len(rows) - len(stale))
+                    if stale:
+                        pending.add(pool.submit(embed_chunk, encoder, stale))
+                # Only a few chunks in flight, so memory doesn't grow with the corpus
+                while len(pending) >= 2 * workers:
+                    pending = save_finished(pending, progress)
+            while pending:
+                pending = save_finished(pending, progress)
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print("Interrupted; finished chunks are saved, run again to resume.")
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and publish a FAISS index bundle from projects.db.")
+    parser.add_argument('--profile', default=EMBEDDING_PROFILE, choices=sorted(EMBEDDING_PROFILES))
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="embedding processes, each loading its own models (default: half the cores)")
+    parser.add_argument('--threads', type=int, default=1, help="torch threads per worker")
+    parser.add_argument('--chunk-size', type=int, default=INDEX_BUILD_CHUNK, help="projects per chunk")
+    parser.add_argument('--nice', type=int, default=10, help="CPU priority decrease, so web traffic goes first")
+    args = parser.parse_args()
+
+    profile = resolve_profile(args.profile)
+    if args.nice and hasattr(os, 'nice'):
+        os.nice(args.nice)
+    t0 = time.time()
+    with app.app_context():
+        prune_stored_embeddings()
+        embed_corpus(profile, args.workers, args.chunk_size, args.threads)
+        print("Embeddings up to date, building the index...", flush=True)
+        build_faiss_index(profile)
+    snapshot = profile_indexes[profile].snapshot
+    if snapshot.index is None:
+        print("No projects to index.")
+        return
+    print(f"Published {profile} index {snapshot.version} ({snapshot.index.ntotal} projects, "
+          f"{snapshot.spec}) in {time.time() - t0:.1f}s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Bulk-load projects from CSV or JSONL files into projects.db.
+
+    python bulk_import.py ai_projects.csv [more.jsonl ...] [--chunk-size 1000] [--embed]
+
+Files are streamed in chunks and upserted with executemany inside a single
+transaction. Projects are keyed on their content hash (title and summary), so
+importing a file twice adds nothing; a changed domain is updated in place and
+published to the saved indexes, so running servers pick it up. With --embed, the new projects are embedded
+after the import commits, one short store transaction per chunk (so the
+database isn't locked during inference and an interrupted run resumes), and
+the index is rebuilt from the stored embeddings.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import time
+from itertools import islice
+
+# Models are only loaded if --embed needs them
+os.environ.setdefault('MODEL_WARMUP', 'lazy')
+os.environ.setdefault('INFERENCE_BATCHING', '0')
+
+from app import (EMBEDDING_PROFILE, EMBEDDING_PROFILES, STORE_QUERY_CHUNK, Project, app, build_faiss_index, db,
+                 ensure_index_loaded, get_project_embeddings, iter_project_chunks, profile_indexes,
+                 project_content_hash, resolve_profile, update_project_metadata)
+
+# Safe for a single large transaction: a crash still rolls back cleanly
+BULK_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",  # 64 MB page cache
+    "PRAGMA temp_store = MEMORY",
+)
+
+UPSERT_SQL = """
+    INSERT INTO project (title, summary, domain, content_hash) VALUES (?, ?, ?, ?)
+    ON CONFLICT (content_hash) DO UPDATE SET domain = excluded.domain
+    WHERE project.domain != excluded.domain
+"""
+
+
+def read_records(path):
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+
+def normalize(record):
+    # Column names are matched case-insensitively (ai_projects.csv uses Title, Summary, Domain)
+    fields = {key.strip().lower(): value for key, value in record.items() if key}
+    title, summary, domain = (str(fields.get(name) or '').strip() for name in ('title', 'summary', 'domain'))
+    if not title or not summary:
+        return None
+    return title, summary, domain
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def select_in(conn, sql, values):
+    # sql has one "{}" placeholder for the IN (...) list
+    values = list(values)
+    for start in range(0, len(values), STORE_QUERY_CHUNK):
+        batch = values[start:start + STORE_QUERY_CHUNK]
+        yield from conn.execute(sql.format(','.join('?' * len(batch))), batch)
+
+
+def upsert_chunk(conn, rows):
+    """Upsert (title, summary, domain) rows; returns (inserted count, ids whose domain changed)."""
+    by_hash = {project_content_hash(title, summary): (title, summary, domain) for title, summary, domain in rows}
+    existing = {content_hash: (pid, domain) for content_hash, pid, domain in select_in(
+        conn, "SELECT content_hash, id, domain FROM project WHERE content_hash IN ({})", by_hash)}
+    conn.executemany(UPSERT_SQL, [(*row, content_hash) for content_hash, row in by_hash.items()])
+    changed = [existing[content_hash][0] for content_hash, row in by_hash.items()
+               if content_hash in existing and existing[content_hash][1] != row[2]]
+    return len(by_hash) - len(existing), changed
+
+
+def embed_new_projects(after_id, chunk_size, profile):
+    # Rows the import added got ids above the previous maximum
+    max_id = db.session.query(db.func.max(Project.id)).scalar() or 0
+    done = 0
+    for rows in iter_project_chunks(max_id, chunk_size, after_id=after_id):
+        get_project_embeddings(rows, EMBEDDING_PROFILES[profile])  # saves them to the store
+        done += len(rows)
+        print(f"Embedded {done} new projects", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load projects from CSV or JSONL files.")
+    parser.add_argument('files', nargs='+', help="CSV (Title, Summary, Domain columns) or JSONL files")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="rows per executemany batch")
+    parser.add_argument('--embed', action='store_true', help="embed new projects and rebuild the index")
+    parser.add_argument('--profile', default=EMBEDDING_PROFILE, choices=sorted(EMBEDDING_PROFILES),
+                        help="index to rebuild with --embed")
+    args = parser.parse_args()
+
+    profile = resolve_profile(args.profile)
+    with app.app_context():
+        db_path = db.engine.url.database
+    t0 = time.time()
+    inserted = skipped = 0
+    changed = []
+    conn = sqlite3.connect(db_path, isolation_level=None)  # transaction managed below
+    try:
+        for pragma in BULK_PRAGMAS:
+            conn.execute(pragma)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            start_id = conn.execute("SELECT MAX(id) FROM project").fetchone()[0] or 0
+            for path in args.files:
+                rows = (normalize(record) for record in read_records(path))
+                for chunk in chunked(rows, args.chunk_size):
+                    valid = [row for row in chunk if row]
+                    skipped += len(chunk) - len(valid)
+                    chunk_inserted, chunk_changed = upsert_chunk(conn, valid)
+                    inserted += chunk_inserted
+                    changed.extend(chunk_changed)
+                    print(f"{path}: {inserted} inserted, {len(changed)} updated, {skipped} skipped", flush=True)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    print(f"Imported in {time.time() - t0:.1f}s: {inserted} new projects, {len(changed)} updated, "
+          f"{skipped} rows without a title or summary skipped.")
+
+    if changed:
+        # Recorded in each saved index's delta; running servers refresh those rows when they reload it
+        with app.app_context():
+            for name in EMBEDDING_PROFILES:
+                ensure_index_loaded(name, build=False, watch=False)
+            update_project_metadata(changed)
+    if args.embed:
+        # The build also embeds rows an interrupted earlier run left behind
+        with app.app_context():
+            embed_new_projects(start_id, args.chunk_size, profile)
+            build_faiss_index(profile)
+        print(f"Published {profile} index {profile_indexes[profile].snapshot.version}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+# Gunicorn settings for serving the backend in production.
+#   gunicorn -c gunicorn.conf.py wsgi:application
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count() // 2)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# Import the app (and load the models) once in the master; workers share the
+# weights copy-on-write instead of each loading their own copy
+preload_app = True
+
+# Torch threads per worker; defaults to an even split of the cores
+torch_threads = int(os.environ.get('TORCH_THREADS', max(1, multiprocessing.cpu_count() // workers)))
+
+
+def post_fork(server, worker):
+    import app
+    app.configure_torch_threads(torch_threads)
+    app.finish_warm_up()
@@ -1 +1,6 @@
 ALTER TABLE history ADD COLUMN results TEXT;
+
+-- Content hash used by bulk_import.py to upsert projects. app.py runs this
+-- migration (and backfills the hashes) on startup.
+ALTER TABLE project ADD COLUMN content_hash VARCHAR(64);
+CREATE UNIQUE INDEX ix_project_content_hash ON project (content_hash);
@@ -0,0 +1,11 @@
+# Production entry point:
+#   gunicorn -c gunicorn.conf.py wsgi:application
+import os
+
+# create_app() loads the models before the server forks its workers; the
+# import itself shouldn't warm up as well
+os.environ.setdefault('MODEL_WARMUP', 'lazy')
+
+from app import create_app
+
+application = create_app()